@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of clean_raw_text: records/second of the original implementation, of the fused one and of clean_many
+(tests/test_text_cleaning.py checks that all of them return exactly the same texts).
+
+Usage: python -m benchmarks.clean_text_benchmark [n_records] [n_jobs]
+"""
+import random
+import sys
+import time
+from src.text_cleaning import _reference_clean_raw_text, clean_raw_text, clean_many
+
+WORDS = ['the', 'stock', 'GME', 'to', 'moon', 'I', 'think', 'that', 'this', 'is', 'not', 'financial', 'advice',
+         'buy', 'hold', '100%', '$420.69', 'Q3', '2021', 'yolo', 'DD:', '&amp;', '&gt;', '&lt;b&gt;bold&lt;/b&gt;',
+         '[deleted]', '[removed]', 'https://www.reddit.com/r/wallstreetbets/comments/l6x130/', 'http://i.imgur.com/x.png',
+         '🚀🚀🚀', 'café', '\n\n', '\t', '...', '!!!', '(edit)', "don't", 'r/wallstreetbets', 'u/DeepFuckingValue']
+
+
+def make_records(n_records, seed=0):
+    rnd = random.Random(seed)
+    return [' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 120))) for _ in range(n_records)]
+
+
+def bench(name, function, records):
+    begin = time.perf_counter()
+    result = function(records)
+    elapsed = time.perf_counter() - begin
+    print(f'{name:<28} {len(records) / elapsed:>12,.0f} records/s')
+    return result
+
+
+if __name__ == '__main__':
+    n_records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    records = make_records(n_records)
+    bench('original clean_raw_text', lambda texts: [_reference_clean_raw_text(t) for t in texts], records)
+    bench('fused clean_raw_text', lambda texts: [clean_raw_text(t) for t in texts], records)
+    bench(f'clean_many(n_jobs={n_jobs})', lambda texts: clean_many(texts, n_jobs=n_jobs), records)
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import threading
+
+
+class CheckpointManifest:
+    """
+    JSON manifest with the last committed created_utc cursor of each extraction (e.g., category/subreddit/kind or
+    user/kind), rewritten atomically each time a cursor is committed
+    """
+
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            path of the JSON manifest, created at the first commit if it does not exist
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        if os.path.exists(filename):
+            with open(filename) as fp:
+                self.cursors = json.load(fp)
+        else:
+            self.cursors = dict()
+
+    @staticmethod
+    def key(*parts):
+        return '/'.join(str(part) for part in parts)
+
+    def get(self, key):
+        """
+        returns the last committed cursor (UNIX timestamp) of key, None if key was never committed:
+        all the records of key with created_utc <= cursor are already saved
+        """
+        return self.cursors.get(key)
+
+    def commit(self, key, cursor):
+        """
+        Records cursor as the last committed cursor of key and rewrites the manifest atomically
+        (i.e., temporary file + rename, a crash leaves either the old or the new manifest)
+        """
+        self.commit_many({key: cursor})
+
+    def commit_many(self, cursors):
+        """
+        Records a dict {key: cursor} with a single atomic rewrite of the manifest (i.e., all the cursors or none
+        of them are committed)
+        """
+        with self._lock:
+            self.cursors.update(cursors)
+            folder = os.path.dirname(os.path.abspath(self.filename))
+            fd, tmp_filename = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(self.cursors, fp, sort_keys=True, indent=4)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_filename, self.filename)
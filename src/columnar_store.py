@@ -0,0 +1,144 @@
+import glob
+import json
+import os
+import uuid
+import datetime
+from src.segment_store import load_category
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for the columnar output
+    pa = None
+    ds = None
+    pq = None
+
+# arrow types of the known attributes, any other attribute is saved as a (JSON encoded) string
+KNOWN_TYPES = {'created_utc': 'int64', 'num_comments': 'int64', 'score': 'int64', 'over_18': 'bool_',
+               'is_self': 'bool_', 'stickied': 'bool_'}
+# text fields replaced by 'clean_text'
+TEXT_FIELDS = ('title', 'selftext', 'body')
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError('The columnar output requires the pyarrow package')
+
+
+class ColumnarWriter:
+    """
+    writes extracted posts and comments as Parquet files partitioned by category, kind and day
+    (i.e., root/category=<category>/kind=<posts|comments>/day=<YYYY-MM-DD>/part-<id>.parquet)
+    """
+
+    def __init__(self, root, post_attributes, comment_attributes):
+        """
+        Parameters
+        ----------
+        root : str
+            path of the root folder of the partitioned dataset
+        post_attributes : list
+            post's attributes saved as columns, together with 'clean_text' and 'date'
+        comment_attributes : list
+            comment's attributes saved as columns, together with 'clean_text', 'date', 'link_id' and 'parent_id'
+        """
+        _check_pyarrow()
+        self.root = root
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        self.columns = {'posts': ['date', 'clean_text'] + [a for a in post_attributes if a not in TEXT_FIELDS],
+                        'comments': ['date', 'clean_text', 'link_id', 'parent_id'] +
+                                    [a for a in comment_attributes if a not in TEXT_FIELDS + ('link_id', 'parent_id')]}
+        self.schemas = {kind: pa.schema([(c, getattr(pa, KNOWN_TYPES.get(c, 'string'))()) for c in columns])
+                        for kind, columns in self.columns.items()}
+
+    def __table(self, kind, records):
+        columns = dict()
+        for column in self.columns[kind]:
+            values = [record.get(column) for record in records]
+            if column not in KNOWN_TYPES:
+                values = [v if v is None or isinstance(v, str) else json.dumps(v) for v in values]
+            columns[column] = values
+        return pa.Table.from_pydict(columns, schema=self.schemas[kind])
+
+    def write(self, category, users):
+        """
+        Writes a dict {user: {'posts': {date: [...]}, 'comments': {date: [...]}}} of a category, one Parquet file
+        for each kind and day
+        """
+        partitions = dict()
+        for user in users:
+            for kind in ('posts', 'comments'):
+                for dt, records in users[user].get(kind, {}).items():
+                    partitions.setdefault((kind, dt), []).extend(records)
+        for (kind, dt), records in partitions.items():
+            day = datetime.datetime.strptime(dt, '%d/%m/%Y').strftime('%Y-%m-%d')
+            folder = os.path.join(self.root, f'category={category}', f'kind={kind}', f'day={day}')
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            pq.write_table(self.__table(kind, records), os.path.join(folder, f'part-{uuid.uuid4().hex}.parquet'))
+
+
+def read_records(root, kind, columns=None, filters=None):
+    """
+    Reads the posts or comments (kind) of a partitioned dataset as a pyarrow Table, reading only the selected
+    columns and only the files matching the filters on the partition columns ('category' and 'day')
+
+    Parameters
+    ----------
+    root : str
+        path of the root folder of the partitioned dataset
+    kind : str
+        'posts' or 'comments'
+    columns : list, optional
+        columns to be read, None to read all of them. The default is None
+    filters : list, optional
+        filters in pyarrow.parquet format, e.g. [('category', '=', 'finance'), ('day', '>=', '2021-01-01')].
+        The default is None
+
+    Example: read_records(root, 'comments', ['author', 'clean_text'], [('day', '<', '2021-02-01')]).to_pandas()
+    """
+    _check_pyarrow()
+    # only the files of kind, so the schema is the one of kind (i.e., the posts and comments have different columns)
+    files = sorted(glob.glob(os.path.join(glob.escape(root), 'category=*', f'kind={kind}', 'day=*', '*.parquet')))
+    dataset = ds.dataset(files, format='parquet', partitioning='hive', partition_base_dir=root)
+    filters = [('kind', '=', kind)] + list(filters or [])
+    return dataset.to_table(columns=columns, filter=pq.filters_to_expression(filters))
+
+
+def convert_json_tree(raw_data_folder, root, post_attributes, comment_attributes, categories=None,
+                      batch_size=100000):
+    """
+    Converts the Categories_raw_data tree (user JSON files or SegmentStore of each category) in a partitioned
+    columnar dataset
+
+    Parameters
+    ----------
+    raw_data_folder : str
+        path of the Categories_raw_data folder
+    root : str
+        path of the root folder of the partitioned dataset
+    post_attributes : list
+        post's attributes saved as columns
+    comment_attributes : list
+        comment's attributes saved as columns
+    categories : list, optional
+        categories to be converted, None to convert all of them. The default is None
+    batch_size : int, optional
+        number of records buffered before writing them. The default is 100000
+    """
+    writer = ColumnarWriter(root, post_attributes, comment_attributes)
+    if categories is None:
+        categories = [c for c in sorted(os.listdir(raw_data_folder))
+                      if os.path.isdir(os.path.join(raw_data_folder, c))]
+    for category in categories:
+        buffer, n_records = dict(), 0
+        for user, data in load_category(os.path.join(raw_data_folder, category)):
+            buffer[user] = data
+            n_records += sum(len(records) for kind in ('posts', 'comments') for records in data[kind].values())
+            if n_records >= batch_size:
+                writer.write(category, buffer)
+                buffer, n_records = dict(), 0
+        writer.write(category, buffer)
+        print('Converted category:', category)
@@ -0,0 +1,238 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dateutil.relativedelta import relativedelta
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed to read the dumps
+    zstandard = None
+
+
+def _month_filename(dump_folder, kind, month):
+    prefix = 'RS' if kind == 'posts' else 'RC'
+    return os.path.join(dump_folder, f"{prefix}_{month.strftime('%Y-%m')}.zst")
+
+
+def _read_month(filename, start_date, end_date, subreddit=None, author=None):
+    """
+    Generator over the records of a Pushshift monthly dump (zstd NDJSON) with start_date < created_utc < end_date
+    and matching subreddit/author (case insensitive, author can be a comma separated list of authors),
+    decompressed as a stream (i.e., constant memory)
+    """
+    needles = author.lower().split(',') if author is not None else [subreddit.lower()]
+    authors = set(needles)
+    with open(filename, 'rb') as fh:
+        # dumps are compressed with a long window
+        decompressor = zstandard.ZstdDecompressor(max_window_size=2 ** 31)
+        with decompressor.stream_reader(fh) as reader:
+            for line in io.TextIOWrapper(reader, encoding='utf-8', errors='ignore'):
+                # cheap check on the raw line before parsing it
+                lower_line = line.lower()
+                if not any(needle in lower_line for needle in needles):
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    continue
+                created_utc = int(record.get('created_utc', 0))
+                if not start_date < created_utc < end_date:
+                    continue
+                if subreddit is not None and str(record.get('subreddit')).lower() != needles[0]:
+                    continue
+                if author is not None and str(record.get('author')).lower() not in authors:
+                    continue
+                record['created_utc'] = created_utc
+                yield record
+
+
+def _read_month_list(filename, start_date, end_date, subreddit=None, author=None, extract_folder=None):
+    if extract_folder is not None:
+        return list(_read_extract(extract_folder, start_date, end_date, subreddit))
+    return list(_read_month(filename, start_date, end_date, subreddit=subreddit, author=author))
+
+
+def _extract_filename(extract_folder, subreddit):
+    return os.path.join(extract_folder, f'{subreddit.lower()}.ndjson')
+
+
+def _extract_month(filename, start_date, end_date, subreddits, extract_folder):
+    """
+    Scans a Pushshift monthly dump once, writing the records of each subreddit in subreddits with
+    start_date < created_utc < end_date to an NDJSON extract of extract_folder (see _extract_filename), in dump order
+    """
+    needles = [subreddit.lower() for subreddit in subreddits]
+    subreddits = set(needles)
+    os.makedirs(extract_folder, exist_ok=True)
+    extracts = dict()
+    try:
+        with open(filename, 'rb') as fh:
+            decompressor = zstandard.ZstdDecompressor(max_window_size=2 ** 31)
+            with decompressor.stream_reader(fh) as reader:
+                for line in io.TextIOWrapper(reader, encoding='utf-8', errors='ignore'):
+                    lower_line = line.lower()
+                    if not any(needle in lower_line for needle in needles):
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.decoder.JSONDecodeError:
+                        continue
+                    created_utc = int(record.get('created_utc', 0))
+                    if not start_date < created_utc < end_date:
+                        continue
+                    subreddit = str(record.get('subreddit')).lower()
+                    if subreddit not in subreddits:
+                        continue
+                    record['created_utc'] = created_utc
+                    if subreddit not in extracts:
+                        extracts[subreddit] = open(_extract_filename(extract_folder, subreddit), 'w')
+                    extracts[subreddit].write(json.dumps(record) + '\n')
+    finally:
+        for fp in extracts.values():
+            fp.close()
+
+
+def _read_extract(extract_folder, start_date, end_date, subreddit):
+    """
+    Generator over the records of a subreddit extract (see _extract_month) with start_date < created_utc < end_date
+    """
+    filename = _extract_filename(extract_folder, subreddit)
+    if not os.path.exists(filename):  # no records of the subreddit in the month
+        return
+    with open(filename) as fp:
+        for line in fp:
+            record = json.loads(line)
+            if start_date < record['created_utc'] < end_date:
+                yield record
+
+
+class PushshiftDumpReader:
+    """
+    offline data source reading Pushshift monthly dumps (RS_YYYY-MM.zst for posts, RC_YYYY-MM.zst for comments)
+    stored in a local folder, used by RedditHandler instead of the API
+    """
+
+    def __init__(self, dump_folder, n_workers=1, page_size=500):
+        """
+        Parameters
+        ----------
+        dump_folder : str
+            path of the folder containing the RS_/RC_ monthly dump files
+        n_workers : int, optional
+            number of monthly files decompressed in parallel (one process each), 1 to read them one after the
+            other in constant memory. The default is 1
+        page_size : int, optional
+            number of records in each page returned to RedditHandler. The default is 500
+        """
+        if zstandard is None:
+            raise ImportError('PushshiftDumpReader requires the zstandard package')
+        self.dump_folder = dump_folder
+        self.n_workers = n_workers
+        self.page_size = page_size
+        # dump file -> (start_date, end_date, subreddits, folder) of its subreddit extracts (see extract_subreddits)
+        self._extracts = dict()
+        self._extracts_folder = None
+
+    def __month_files(self, kind, start_date, end_date):
+        """
+        returns the existing dump files of kind ('posts' or 'comments') covering start_date-end_date
+        (UNIX timestamps), in chronological order
+        """
+        month = datetime.datetime.utcfromtimestamp(start_date).replace(day=1, hour=0, minute=0, second=0)
+        last = datetime.datetime.utcfromtimestamp(end_date)
+        filenames = list()
+        while month <= last:
+            filename = _month_filename(self.dump_folder, kind, month)
+            if os.path.exists(filename):
+                filenames.append(filename)
+            else:
+                print('Missing dump file:', filename)
+            month += relativedelta(months=+1)
+        return filenames
+
+    def extract_subreddits(self, kind, start_date, end_date, subreddits):
+        """
+        Scans each dump file of kind ('posts' or 'comments') covering start_date-end_date (UNIX timestamps) once,
+        writing the records of all the subreddits to temporary per-subreddit extracts: the next calls of pages
+        for one of them in the period read its extracts instead of decompressing the dump again
+        (e.g., one call for all the subreddits, time shards and kinds of a periodical extraction)
+        """
+        if self._extracts_folder is None:
+            self._extracts_folder = tempfile.TemporaryDirectory(prefix='dump_extracts_')
+        subreddits = frozenset(subreddit.lower() for subreddit in subreddits)
+        filenames = self.__month_files(kind, start_date, end_date)
+        folders = [os.path.join(self._extracts_folder.name, os.path.basename(filename)) for filename in filenames]
+        for filename in filenames:
+            self._extracts.pop(filename, None)
+        if self.n_workers <= 1:
+            for filename, folder in zip(filenames, folders):
+                _extract_month(filename, start_date, end_date, subreddits, folder)
+        else:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                list(executor.map(_extract_month, filenames, [start_date] * len(filenames),
+                                  [end_date] * len(filenames), [subreddits] * len(filenames), folders))
+        for filename, folder in zip(filenames, folders):
+            self._extracts[filename] = (start_date, end_date, subreddits, folder)
+
+    def clear_extracts(self):
+        """
+        Removes the subreddit extracts (see extract_subreddits)
+        """
+        self._extracts = dict()
+        if self._extracts_folder is not None:
+            self._extracts_folder.cleanup()
+            self._extracts_folder = None
+
+    def __extract_folder(self, filename, start_date, end_date, subreddit):
+        """
+        returns the folder of the extracts of filename if they contain all the records of subreddit between
+        start_date and end_date, None otherwise
+        """
+        if subreddit is None or filename not in self._extracts:
+            return None
+        extract_start, extract_end, subreddits, folder = self._extracts[filename]
+        if extract_start <= start_date and end_date <= extract_end and subreddit.lower() in subreddits:
+            return folder
+        return None
+
+    def pages(self, kind, start_date, end_date, subreddit=None, author=None):
+        """
+        Generator over the pages (i.e., lists of page_size raw records) of kind ('posts' or 'comments') with
+        start_date < created_utc < end_date (UNIX timestamps), of a subreddit or of an author (or a comma
+        separated list of authors), in dump order
+        (i.e., creation time order)
+        """
+        if (subreddit is None) == (author is None):
+            raise ValueError('Exactly one between subreddit and author has to be specified')
+        filenames = self.__month_files(kind, start_date, end_date)
+        folders = [self.__extract_folder(filename, start_date, end_date, subreddit) for filename in filenames]
+        if self.n_workers <= 1 or all(folder is not None for folder in folders):
+            months = (_read_month(filename, start_date, end_date, subreddit, author) if folder is None else
+                      _read_extract(folder, start_date, end_date, subreddit)
+                      for filename, folder in zip(filenames, folders))
+            executor = None
+        else:
+            # each process returns the filtered records of a month, collected in chronological order
+            executor = ProcessPoolExecutor(max_workers=self.n_workers)
+            futures = [executor.submit(_read_month_list, filename, start_date, end_date, subreddit, author, folder)
+                       for filename, folder in zip(filenames, folders)]
+            months = (future.result() for future in futures)
+        try:
+            page = list()
+            for records in months:
+                for record in records:
+                    page.append(record)
+                    if len(page) == self.page_size:
+                        yield page
+                        page = list()
+            if page:
+                yield page
+        finally:
+            if executor is not None:
+                # the months not started yet are not read (e.g., the generator was closed early)
+                for future in futures:
+                    future.cancel()
+                executor.shutdown()
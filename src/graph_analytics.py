@@ -0,0 +1,104 @@
+import json
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+
+def adjacency(graph):
+    """
+    returns the weighted adjacency matrix (scipy CSR, A[source, target] = number of interactions) of a graph
+    (see graph_store.build_graph)
+    """
+    n_nodes = len(graph['nodes'])
+    return sparse.csr_matrix((graph['weights'].astype(np.float64), graph['indices'], graph['indptr']),
+                             shape=(n_nodes, n_nodes))
+
+
+def pagerank(adj, damping=0.85, tol=1e-10, max_iter=100):
+    """
+    PageRank of the nodes of a weighted adjacency matrix (power iteration, the rank of the nodes without out
+    edges is spread uniformly), the scores sum to 1
+    """
+    n_nodes = adj.shape[0]
+    if n_nodes == 0:
+        return np.zeros(0)
+    out_weight = np.asarray(adj.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inv_out_weight = np.divide(1.0, out_weight, out=np.zeros(n_nodes), where=~dangling)
+    transition = adj.T.tocsr()
+    rank = np.full(n_nodes, 1.0 / n_nodes)
+    for _ in range(max_iter):
+        new_rank = damping * (transition @ (rank * inv_out_weight))
+        new_rank += (damping * rank[dangling].sum() + 1.0 - damping) / n_nodes
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < n_nodes * tol:
+            break
+    return rank
+
+
+def reciprocity(adj):
+    """
+    fraction of the (unweighted) edges between different users whose reverse edge is also in the network
+    """
+    links = adj.astype(bool).tolil()
+    links.setdiag(False)
+    links = links.tocsr()
+    links.eliminate_zeros()
+    if links.nnz == 0:
+        return 0.0
+    return links.multiply(links.T).nnz / links.nnz
+
+
+def compute_metrics(graph, damping=0.85):
+    """
+    Computes the metrics of a weighted network (see graph_store.build_graph)
+    returns a dict of node metrics (arrays aligned with graph['nodes']): in/out degree, in/out weighted degree,
+    weakly/strongly connected component, PageRank; and a dict with the summary of the network
+    """
+    adj = adjacency(graph)
+    links = adj.astype(bool).astype(np.int64)
+    n_weak, weak = connected_components(adj, directed=True, connection='weak')
+    n_strong, strong = connected_components(adj, directed=True, connection='strong')
+    nodes = {
+        'in_degree': np.asarray(links.sum(axis=0)).ravel(),
+        'out_degree': np.asarray(links.sum(axis=1)).ravel(),
+        'in_weight': np.asarray(adj.sum(axis=0)).ravel().astype(np.int64),
+        'out_weight': np.asarray(adj.sum(axis=1)).ravel().astype(np.int64),
+        'weak_component': weak,
+        'strong_component': strong,
+        'pagerank': pagerank(adj, damping=damping),
+    }
+    n_nodes = adj.shape[0]
+    summary = {
+        'n_nodes': n_nodes,
+        'n_edges': int(adj.nnz),
+        'n_interactions': int(graph['weights'].sum()),
+        'n_self_loops': int(np.count_nonzero(adj.diagonal())),
+        'density': adj.nnz / (n_nodes * (n_nodes - 1)) if n_nodes > 1 else 0.0,
+        'reciprocity': reciprocity(adj),
+        'n_weak_components': int(n_weak),
+        'largest_weak_component': int(np.bincount(weak).max()) if n_nodes else 0,
+        'n_strong_components': int(n_strong),
+        'largest_strong_component': int(np.bincount(strong).max()) if n_nodes else 0,
+    }
+    return nodes, summary
+
+
+def write_metrics(path_prefix, graph, damping=0.85):
+    """
+    Writes the metrics of a weighted network: {path_prefix}_metrics.csv with a row for each user
+    'username,in_degree,out_degree,in_weight,out_weight,weak_component,strong_component,pagerank' and
+    {path_prefix}_summary.json
+    returns the summary
+    """
+    nodes, summary = compute_metrics(graph, damping=damping)
+    columns = list(nodes)
+    with open(f'{path_prefix}_metrics.csv', 'w') as out:
+        out.write(','.join(['username'] + columns) + '\n')
+        values = [nodes[column].tolist() for column in columns]
+        for username, row in zip(graph['nodes'].tolist(), zip(*values)):
+            out.write(','.join([username] + [repr(value) for value in row]) + '\n')
+    with open(f'{path_prefix}_summary.json', 'w') as fp:
+        json.dump(summary, fp, sort_keys=True, indent=4)
+    return summary
@@ -0,0 +1,109 @@
+import datetime
+import numpy as np
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day(dt):
+    """
+    returns the number of days since 1970-01-01 of a date in format %d/%m/%Y
+    """
+    return (datetime.datetime.strptime(dt, '%d/%m/%Y').date() - _EPOCH).days
+
+
+def from_day(day):
+    return (_EPOCH + datetime.timedelta(days=int(day))).strftime('%d/%m/%Y')
+
+
+def read_edge_list(filename):
+    """
+    Reads an edge list 'comment_id,parent_id,author,parent_author,date' (i.e., {category}_complete.csv)
+    returns usernames (list) and the arrays of sources, targets (indexes of usernames) and days of the edges
+    """
+    user_ids = dict()
+    days = dict()
+    sources, targets, edge_days = list(), list(), list()
+    with open(filename) as fp:
+        for row in fp:
+            _, _, author, parent_author, dt = row.rstrip('\n').split(',')
+            sources.append(user_ids.setdefault(author, len(user_ids)))
+            targets.append(user_ids.setdefault(parent_author, len(user_ids)))
+            if dt not in days:
+                days[dt] = to_day(dt)
+            edge_days.append(days[dt])
+    return (list(user_ids), np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64),
+            np.array(edge_days, dtype=np.int32))
+
+
+def aggregate_edges(usernames, sources, targets, days):
+    """
+    Aggregates the interactions (i.e., one edge for each comment) in weighted edges: nodes are renumbered in
+    username order (only the users with at least one interaction), so the result does not depend on the order of
+    the interactions
+    returns nodes (array of usernames) and the arrays of sources, targets, counts, first and last day of the
+    weighted edges, sorted by source and target
+    """
+    if len(sources) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(0, dtype=str), empty, empty, empty, empty, empty
+    used = np.unique(np.concatenate([sources, targets]))
+    names = np.array([usernames[i] for i in used], dtype=str)
+    order = np.argsort(names, kind='stable')
+    nodes = names[order]
+    # old user index -> node index
+    remap = np.zeros(len(usernames), dtype=np.int64)
+    remap[used[order]] = np.arange(len(nodes))
+    n_nodes = max(1, len(nodes))
+    keys = remap[sources] * n_nodes + remap[targets]
+    order = np.lexsort((days, keys))
+    keys, days = keys[order], days[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    return (nodes, keys[starts] // n_nodes, keys[starts] % n_nodes, (ends - starts).astype(np.int64),
+            days[starts], days[ends - 1])
+
+
+def build_graph(usernames, sources, targets, days):
+    """
+    returns the weighted network of a list of interactions as a dict with the CSR adjacency (indptr, indices,
+    weights, first_day, last_day as days since 1970-01-01) and the node table (nodes)
+    """
+    nodes, edge_sources, edge_targets, counts, first_days, last_days = aggregate_edges(usernames, sources,
+                                                                                       targets, days)
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_sources, minlength=len(nodes)), out=indptr[1:])
+    return {'indptr': indptr, 'indices': edge_targets.astype(np.int32), 'weights': counts,
+            'first_day': first_days.astype(np.int32), 'last_day': last_days.astype(np.int32), 'nodes': nodes}
+
+
+def write_graph(path_prefix, graph):
+    """
+    Writes a weighted network (see build_graph):
+    {path_prefix}_weighted.csv with rows 'source,target,count,first_date,last_date',
+    {path_prefix}_nodes.csv with rows 'node_id,username' and
+    {path_prefix}_graph.npz with the arrays of graph, loaded by load_graph without parsing
+    """
+    np.savez(f'{path_prefix}_graph.npz', **graph)
+    nodes = graph['nodes'].tolist()
+    with open(f'{path_prefix}_nodes.csv', 'w') as out:
+        for node_id, username in enumerate(nodes):
+            out.write(f'{node_id},{username}\n')
+    sources = np.repeat(np.arange(len(nodes)), np.diff(graph['indptr']))
+    with open(f'{path_prefix}_weighted.csv', 'w') as out:
+        dates = dict()
+        for source, target, count, first_day, last_day in zip(sources.tolist(), graph['indices'].tolist(),
+                                                              graph['weights'].tolist(),
+                                                              graph['first_day'].tolist(),
+                                                              graph['last_day'].tolist()):
+            for day in (first_day, last_day):
+                if day not in dates:
+                    dates[day] = from_day(day)
+            out.write(f'{nodes[source]},{nodes[target]},{count},{dates[first_day]},{dates[last_day]}\n')
+
+
+def load_graph(filename):
+    """
+    returns a dict with the arrays of a {category}_graph.npz file (see write_graph)
+    """
+    with np.load(filename, allow_pickle=False) as graph:
+        return {name: graph[name] for name in graph.files}
@@ -0,0 +1,337 @@
+import json
+import pickle
+import re
+import sys
+import numpy as np
+
+# layers without effect at inference time
+_IDENTITY_LAYERS = ('InputLayer', 'Dropout', 'SpatialDropout1D', 'GaussianNoise', 'GaussianDropout')
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    # same definition of keras 2 (i.e., the version used to train the model)
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0.0, 1.0),
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'softmax': lambda x: np.exp(x - x.max(axis=-1, keepdims=True)) / np.exp(x - x.max(axis=-1, keepdims=True)).sum(
+        axis=-1, keepdims=True),
+}
+
+
+def pad_post(sequences, maxlen=350):
+    """
+    Pads the sequences with zeros at the end and truncates the longer ones keeping their last maxlen tokens (i.e.,
+    keras pad_sequences(sequences, maxlen=maxlen, padding='post')), returns an int32 matrix
+    """
+    lengths = np.fromiter((min(len(sequence), maxlen) for sequence in sequences), dtype=np.int64,
+                          count=len(sequences))
+    padded = np.zeros((len(sequences), maxlen), dtype=np.int32)
+    if lengths.sum():
+        tokens = np.fromiter((token for sequence, length in zip(sequences, lengths.tolist()) if length
+                              for token in sequence[len(sequence) - length:]), dtype=np.int32, count=lengths.sum())
+        rows = np.repeat(np.arange(len(sequences)), lengths)
+        # position of each token in its row
+        columns = np.arange(len(tokens)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        padded[rows, columns] = tokens
+    return padded
+
+
+class VocabTokenizer:
+    """
+    keras-free copy of the texts_to_sequences of a fitted keras Tokenizer (same lowercasing, filters, split,
+    num_words and out-of-vocabulary token)
+    """
+
+    def __init__(self, word_index, num_words=None, oov_token=None, filters='', lower=True, split=' ',
+                 char_level=False):
+        self.word_index = word_index
+        self.num_words = num_words
+        self.oov_token = oov_token
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.char_level = char_level
+        self._filters_table = str.maketrans({char: split for char in filters})
+
+    def config(self):
+        return {'word_index': self.word_index, 'num_words': self.num_words, 'oov_token': self.oov_token,
+                'filters': self.filters, 'lower': self.lower, 'split': self.split, 'char_level': self.char_level}
+
+    def words(self, text):
+        if self.lower:
+            text = text.lower()
+        if self.char_level:
+            return list(text)
+        return [word for word in text.translate(self._filters_table).split(self.split) if word]
+
+    def texts_to_sequences(self, texts):
+        word_index = self.word_index
+        num_words = self.num_words
+        oov_index = word_index.get(self.oov_token) if self.oov_token is not None else None
+        sequences = list()
+        for text in texts:
+            sequence = list()
+            for word in self.words(text):
+                index = word_index.get(word)
+                if index is not None and (not num_words or index < num_words):
+                    sequence.append(index)
+                elif oov_index is not None:
+                    sequence.append(oov_index)
+            sequences.append(sequence)
+        return sequences
+
+
+def _model_layers(model_config):
+    """
+    returns the layers of a Sequential model config used at inference time, with their name in the keras 3 weights
+    files (i.e., class name in snake case numbered by class, e.g., embedding, lstm, dense, dense_1)
+    """
+    config = model_config['config']
+    layers = config['layers'] if isinstance(config, dict) else config
+    counts = dict()
+    model_layers = list()
+    for layer in layers:
+        if layer['class_name'] == 'InputLayer':
+            continue
+        path = re.sub('([a-z])([A-Z])', r'\1_\2', re.sub('(.)([A-Z][a-z]+)', r'\1_\2', layer['class_name'])).lower()
+        count = counts.get(path, 0)
+        counts[path] = count + 1
+        if layer['class_name'] not in _IDENTITY_LAYERS:
+            model_layers.append((layer, f'{path}_{count}' if count else path))
+    return model_layers
+
+
+def _layer_weights(h5_file, layer_name, layer_path):
+    """
+    returns the list of weights of a layer saved by keras 2 (save_weights or model.save, groups named as the layers)
+    or keras 3 (.weights.h5, groups named as layer_path)
+    """
+    if 'layers' in h5_file and 'model_weights' not in h5_file and 'layer_names' not in h5_file.attrs:
+        weights = list()
+
+        def collect(group):
+            if 'vars' in group:
+                weights.extend(group['vars'][name][()] for name in sorted(group['vars'], key=int))
+            for child in sorted((name for name in group if name != 'vars'),
+                                key=lambda name: (name != 'forward_layer', name)):
+                collect(group[child])
+
+        collect(h5_file['layers'][layer_path])
+        return weights
+    group = h5_file['model_weights'] if 'model_weights' in h5_file else h5_file
+    layer = group[layer_name]
+    return [layer[name][()] for name in (name.decode('utf-8') if isinstance(name, bytes) else name
+                                         for name in layer.attrs['weight_names'])]
+
+
+def _quantize(name, weights, quantization, arrays):
+    if quantization == 'int8' and weights.ndim == 2:
+        # symmetric quantization with a scale for each row of the embeddings and for each column of the kernels
+        axis = 1 if name.endswith('embeddings') else 0
+        scale = np.abs(weights).max(axis=axis, keepdims=True) / 127.0
+        scale[scale == 0] = 1.0
+        arrays[name] = np.round(weights / scale).astype(np.int8)
+        arrays[name + '_scale'] = scale.astype(np.float32)
+    elif quantization in ('float16', 'int8'):
+        arrays[name] = weights.astype(np.float16)
+    else:
+        arrays[name] = weights.astype(np.float32)
+
+
+def export_keras_model(file_model, file_weights, file_tokenizer, out_file, quantization=None):
+    """
+    Exports the GloVe+LSTM keras model (architecture JSON, h5 weights and pickled tokenizer) in a single .npz file
+    loaded by NumpyLSTMModel without keras/tensorflow
+
+    Parameters
+    ----------
+    file_model : str
+        path of the model architecture (.json)
+    file_weights : str
+        path of the model weights (.h5)
+    file_tokenizer : str
+        path of the pickled keras Tokenizer (.pickle)
+    out_file : str
+        path of the exported model (.npz)
+    quantization : str, optional
+        None to keep float32 weights, 'float16' or 'int8' to store quantized weights. The default is None
+    """
+    import h5py
+    if quantization not in (None, 'float16', 'int8'):
+        raise ValueError(f'Unknown quantization {quantization}, it has to be None, float16 or int8')
+    with open(file_model) as fp:
+        model_config = json.load(fp)
+    with open(file_tokenizer, 'rb') as fp:
+        tokenizer = pickle.load(fp)
+    layers = list()
+    arrays = dict()
+    with h5py.File(file_weights, 'r') as h5_file:
+        for i, (layer, layer_path) in enumerate(_model_layers(model_config)):
+            class_name = layer['class_name']
+            config = layer['config']
+            weights = _layer_weights(h5_file, config['name'], layer_path)
+            spec = {'class_name': class_name}
+            if class_name == 'Embedding':
+                spec['mask_zero'] = bool(config.get('mask_zero', False))
+                names = ['embeddings']
+            elif class_name in ('LSTM', 'Bidirectional'):
+                cell = config['layer']['config'] if class_name == 'Bidirectional' else config
+                spec.update(activation=cell.get('activation', 'tanh'),
+                            recurrent_activation=cell.get('recurrent_activation', 'sigmoid'),
+                            return_sequences=bool(cell.get('return_sequences', False)),
+                            go_backwards=bool(cell.get('go_backwards', False)),
+                            use_bias=bool(cell.get('use_bias', True)))
+                if class_name == 'Bidirectional':
+                    if config['layer']['class_name'] != 'LSTM':
+                        raise ValueError(f"Unsupported layer Bidirectional({config['layer']['class_name']})")
+                    spec['merge_mode'] = config.get('merge_mode', 'concat')
+                    names = [f'{direction}_{name}' for direction in ('forward', 'backward')
+                             for name in ('kernel', 'recurrent_kernel', 'bias')[:3 if spec['use_bias'] else 2]]
+                else:
+                    names = ['kernel', 'recurrent_kernel', 'bias'][:3 if spec['use_bias'] else 2]
+            elif class_name == 'Dense':
+                spec.update(activation=config.get('activation', 'linear'), use_bias=bool(config.get('use_bias', True)))
+                names = ['kernel', 'bias'][:2 if spec['use_bias'] else 1]
+            elif class_name == 'Activation':
+                spec['activation'] = config['activation']
+                names = []
+            else:
+                raise ValueError(f'Unsupported layer {class_name}')
+            if len(weights) != len(names):
+                raise ValueError(f"Layer {config['name']}: expected {len(names)} weights, found {len(weights)}")
+            for name, weight in zip(names, weights):
+                _quantize(f'{i}_{name}', np.asarray(weight), quantization, arrays)
+            layers.append(spec)
+    tokenizer_config = VocabTokenizer(tokenizer.word_index, num_words=tokenizer.num_words,
+                                      oov_token=tokenizer.oov_token, filters=tokenizer.filters,
+                                      lower=tokenizer.lower, split=tokenizer.split,
+                                      char_level=tokenizer.char_level).config()
+    config = {'layers': layers, 'tokenizer': tokenizer_config, 'quantization': quantization}
+    np.savez(out_file, __config__=np.array(json.dumps(config)), **arrays)
+
+
+class NumpyLSTMModel:
+    """
+    batched forward pass of the exported GloVe+LSTM model (embedding, LSTM, dense layers) with NumPy only, with the
+    same predict interface of the keras model
+    """
+
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            path of the .npz file written by export_keras_model
+        """
+        with np.load(filename, allow_pickle=False) as arrays:
+            config = json.loads(str(arrays['__config__']))
+            weights = {name: arrays[name] for name in arrays.files if name != '__config__'}
+        self.layers = config['layers']
+        self.quantization = config['quantization']
+        self.tokenizer = VocabTokenizer(**config['tokenizer'])
+        self.weights = dict()
+        for name, weight in weights.items():
+            if name.endswith('_scale'):
+                continue
+            if name.endswith('embeddings'):
+                # kept quantized, dequantized row by row at lookup
+                self.weights[name] = weight
+                if name + '_scale' in weights:
+                    self.weights[name + '_scale'] = weights[name + '_scale'].reshape(-1)
+            elif name + '_scale' in weights:
+                self.weights[name] = weight.astype(np.float32) * weights[name + '_scale']
+            else:
+                self.weights[name] = weight.astype(np.float32)
+        self.mask_zero = any(layer['class_name'] == 'Embedding' and layer['mask_zero'] for layer in self.layers)
+
+    def __embed(self, i, tokens):
+        embeddings = self.weights[f'{i}_embeddings']
+        x = embeddings[tokens].astype(np.float32)
+        if f'{i}_embeddings_scale' in self.weights:
+            x *= self.weights[f'{i}_embeddings_scale'][tokens][..., None]
+        return x
+
+    @staticmethod
+    def __lstm(x, mask, kernel, recurrent_kernel, bias, spec, go_backwards):
+        n, n_steps, _ = x.shape
+        units = recurrent_kernel.shape[0]
+        activation = _ACTIVATIONS[spec['activation']]
+        recurrent_activation = _ACTIVATIONS[spec['recurrent_activation']]
+        h = np.zeros((n, units), dtype=np.float32)
+        c = np.zeros((n, units), dtype=np.float32)
+        outputs = np.zeros((n, n_steps, units), dtype=np.float32) if spec['return_sequences'] else None
+        steps = range(n_steps - 1, -1, -1) if go_backwards else range(n_steps)
+        for t in steps:
+            step_mask = None if mask is None else mask[:, t]
+            if step_mask is not None and not step_mask.any():
+                # all the sequences are padding at this step: states unchanged
+                if outputs is not None:
+                    outputs[:, t] = h
+                continue
+            z = x[:, t] @ kernel + h @ recurrent_kernel
+            if bias is not None:
+                z += bias
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            candidate = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            new_c = f * c + i * candidate
+            new_h = o * activation(new_c)
+            if step_mask is None:
+                h, c = new_h, new_c
+            else:
+                h = np.where(step_mask[:, None], new_h, h)
+                c = np.where(step_mask[:, None], new_c, c)
+            if outputs is not None:
+                outputs[:, t] = h
+        return outputs if outputs is not None else h
+
+    def predict(self, x, batch_size=None):
+        """
+        returns the predictions (float32 array with one row for each sequence) of a padded int matrix
+        """
+        x = np.asarray(x)
+        mask = None
+        for i, spec in enumerate(self.layers):
+            class_name = spec['class_name']
+            if class_name == 'Embedding':
+                if spec['mask_zero']:
+                    mask = x != 0
+                x = self.__embed(i, x)
+            elif class_name == 'LSTM':
+                x = self.__lstm(x, mask, self.weights[f'{i}_kernel'], self.weights[f'{i}_recurrent_kernel'],
+                                self.weights.get(f'{i}_bias'), spec, spec['go_backwards'])
+            elif class_name == 'Bidirectional':
+                forward = self.__lstm(x, mask, self.weights[f'{i}_forward_kernel'],
+                                      self.weights[f'{i}_forward_recurrent_kernel'],
+                                      self.weights.get(f'{i}_forward_bias'), spec, False)
+                backward = self.__lstm(x, mask, self.weights[f'{i}_backward_kernel'],
+                                       self.weights[f'{i}_backward_recurrent_kernel'],
+                                       self.weights.get(f'{i}_backward_bias'), spec, True)
+                if spec['merge_mode'] == 'concat':
+                    x = np.concatenate([forward, backward], axis=-1)
+                elif spec['merge_mode'] == 'sum':
+                    x = forward + backward
+                elif spec['merge_mode'] == 'mul':
+                    x = forward * backward
+                else:
+                    x = (forward + backward) / 2
+            elif class_name == 'Dense':
+                x = x @ self.weights[f'{i}_kernel']
+                if spec['use_bias']:
+                    x = x + self.weights[f'{i}_bias']
+                x = _ACTIVATIONS[spec['activation']](x)
+            else:
+                x = _ACTIVATIONS[spec['activation']](x)
+            if x.ndim == 2:
+                mask = None
+        return x.astype(np.float32)
+
+    # same interface of the keras Sequential model
+    predict_proba = predict
+
+
+if __name__ == '__main__':
+    # e.g., python -m src.lstm_inference Model/model_glove.json Model/model_glove.h5 Model/tokenizer_def.pickle
+    # Model/model_glove.npz int8
+    export_keras_model(*sys.argv[1:5], quantization=sys.argv[5] if len(sys.argv) > 5 else None)
@@ -0,0 +1,390 @@
+import datetime
+import json
+import os
+import shutil
+from array import array
+import numpy as np
+from src.graph_store import to_day
+from src.segment_store import category_sizes, list_category, load_category
+from src.seen_index import SeenIndex
+from src.thing_index import ThingIndex
+
+_BASE36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def _is_base36(thing_id):
+    # reddit IDs are lowercase base 36 integers without leading zeros, so int(thing_id, 36) is reversible
+    if not (thing_id.isascii() and thing_id.isalnum()) or thing_id != thing_id.lower():
+        return False
+    return thing_id[0] != '0' or thing_id == '0'
+
+
+def _to_base36(number):
+    digits = list()
+    while True:
+        number, digit = divmod(number, 36)
+        digits.append(_BASE36[digit])
+        if number == 0:
+            return ''.join(reversed(digits))
+
+
+class NetworkBuilder:
+    """
+    builds the users' interaction network of a category in a single pass over the user data: usernames, thing IDs
+    (i.e., IDs of posts and comments) and dates are interned to integers, the comment edges are kept in compact
+    arrays and their parent authors are resolved in memory once all the users are added
+    """
+
+    def __init__(self):
+        self.usernames = list()
+        self.user_ids = dict()
+        self.dates = list()
+        self.date_ids = dict()
+        # thing IDs which are not reddit base 36 IDs are interned with negative keys
+        self.other_things = list()
+        self.other_thing_ids = dict()
+        self.thing_authors = dict()  # thing key -> user ID of its author
+        # comment edges: comment, parent, author and date of each comment
+        self.comments = array('q')
+        self.parents = array('q')
+        self.authors = array('i')
+        self.edge_dates = array('i')
+
+    @staticmethod
+    def __intern(value, ids, values):
+        key = ids.get(value)
+        if key is None:
+            key = ids[value] = len(values)
+            values.append(value)
+        return key
+
+    def thing_key(self, thing_id):
+        if _is_base36(thing_id):
+            return int(thing_id, 36)
+        return -1 - self.__intern(thing_id, self.other_thing_ids, self.other_things)
+
+    def thing_id(self, key):
+        return _to_base36(key) if key >= 0 else self.other_things[-1 - key]
+
+    def user_id(self, username):
+        return self.__intern(username, self.user_ids, self.usernames)
+
+    def add_user(self, data):
+        """
+        Adds the data of a user (i.e., {'posts': {date: [...]}, 'comments': {date: [...]}}): each comment is an edge
+        from its author to the author of its parent, each post/comment is a possible parent
+        """
+        for dt, comments in data['comments'].items():
+            date_id = self.__intern(dt, self.date_ids, self.dates)
+            for comment in comments:
+                comment_key = self.thing_key(comment['id'])
+                author = self.user_id(comment['author'])
+                self.comments.append(comment_key)
+                self.parents.append(self.thing_key(comment['parent_id'].split('_')[1]))
+                self.authors.append(author)
+                self.edge_dates.append(date_id)
+                self.thing_authors[comment_key] = author
+        for posts in data['posts'].values():
+            for post in posts:
+                self.thing_authors[self.thing_key(post['id'])] = self.user_id(post['author'])
+
+    def add_edge(self, comment_id, parent_id, author, dt):
+        """
+        Adds the edge of a comment without adding it as a possible parent (i.e., an edge still to be resolved)
+        """
+        self.comments.append(self.thing_key(comment_id))
+        self.parents.append(self.thing_key(parent_id))
+        self.authors.append(self.user_id(author))
+        self.edge_dates.append(self.__intern(dt, self.date_ids, self.dates))
+
+    def merge(self, other):
+        """
+        Appends the users and edges of other (i.e., a builder of the users following the ones of self), remapping
+        its interned IDs: the result is the same builder obtained adding all the users to self
+        """
+        users = [self.user_id(username) for username in other.usernames]
+        dates = [self.__intern(dt, self.date_ids, self.dates) for dt in other.dates]
+        things = [self.thing_key(thing_id) for thing_id in other.other_things]
+
+        def thing_key(key):
+            return key if key >= 0 else things[-1 - key]
+
+        self.comments.extend(thing_key(key) for key in other.comments)
+        self.parents.extend(thing_key(key) for key in other.parents)
+        self.authors.extend(users[author] for author in other.authors)
+        self.edge_dates.extend(dates[date_id] for date_id in other.edge_dates)
+        for key, author in other.thing_authors.items():
+            self.thing_authors[thing_key(key)] = users[author]
+
+    def resolve_parents(self, thing_index):
+        """
+        Resolves with thing_index (i.e., ThingIndex) the parents not found in the user data (e.g., posts/comments
+        extracted in other time windows or categories), returns the number of parents resolved
+        """
+        thing_authors = self.thing_authors
+        missing = sorted({parent for parent in self.parents if parent not in thing_authors})
+        found = thing_index.lookup(self.thing_id(parent) for parent in missing)
+        for parent in missing:
+            thing_id = self.thing_id(parent)
+            if thing_id in found:
+                thing_authors[parent] = self.user_id(found[thing_id][0])
+        return len(found)
+
+    def edges(self):
+        """
+        Generator over the resolved edges (comment key, parent key, author ID, parent author ID, date ID), in the
+        order the comments were added; the edges whose parent is not found are dropped (see n_dropped)
+        """
+        self.n_dropped = 0
+        thing_authors = self.thing_authors
+        for i in range(len(self.comments)):
+            parent_author = thing_authors.get(self.parents[i])
+            if parent_author is None:
+                self.n_dropped += 1
+                continue
+            yield self.comments[i], self.parents[i], self.authors[i], parent_author, self.edge_dates[i]
+
+    def unresolved(self):
+        """
+        Generator over the edges whose parent is not found, as (comment_id, parent_id, author, date) strings
+        """
+        thing_authors = self.thing_authors
+        for i in range(len(self.comments)):
+            if self.parents[i] not in thing_authors:
+                yield (self.thing_id(self.comments[i]), self.thing_id(self.parents[i]),
+                       self.usernames[self.authors[i]], self.dates[self.edge_dates[i]])
+
+    def interactions(self):
+        """
+        returns usernames and the arrays of sources, targets (user IDs) and days (since 1970-01-01) of the resolved
+        edges (i.e., the input of graph_store.build_graph)
+        """
+        days = np.array([to_day(dt) for dt in self.dates], dtype=np.int32)
+        sources, targets, date_ids = array('q'), array('q'), array('q')
+        for _, _, author, parent_author, date_id in self.edges():
+            sources.append(author)
+            targets.append(parent_author)
+            date_ids.append(date_id)
+        return (self.usernames, np.frombuffer(sources, dtype=np.int64), np.frombuffer(targets, dtype=np.int64),
+                days[np.frombuffer(date_ids, dtype=np.int64)])
+
+    def format_edge(self, edge):
+        """
+        returns the row 'comment_id,parent_id,author,parent_author,date' of an edge yielded by edges()
+        """
+        comment, parent, author, parent_author, date_id = edge
+        return (f'{self.thing_id(comment)},{self.thing_id(parent)},{self.usernames[author]},'
+                f'{self.usernames[parent_author]},{self.dates[date_id]}\n')
+
+    def write_csv(self, filename, snapshots=None):
+        """
+        Writes the edge list 'comment_id,parent_id,author,parent_author,date' (i.e., the {category}_complete.csv
+        file), and the same edges split by time window when snapshots (i.e., SnapshotWriter) is given;
+        returns the number of edges written and of edges dropped for an unresolved parent
+        """
+        n_edges = 0
+        with open(filename, 'w') as out:
+            for edge in self.edges():
+                row = self.format_edge(edge)
+                out.write(row)
+                if snapshots is not None:
+                    snapshots.add(self.dates[edge[4]], row)
+                n_edges += 1
+        if snapshots is not None:
+            snapshots.flush()
+        return n_edges, self.n_dropped
+
+
+def _build_shard(path_category, users):
+    builder = NetworkBuilder()
+    for _, data in load_category(path_category, users):
+        builder.add_user(data)
+    return builder
+
+
+def build_network(path_category, executor=None, n_shards=16, users=None):
+    """
+    returns the NetworkBuilder of the users of a category
+
+    Parameters
+    ----------
+    path_category : str
+        path of the category folder (user JSON files or SegmentStore)
+    executor : concurrent.futures.Executor, optional
+        pool parsing disjoint shards of the user files, merged in order (i.e., same result of the sequential
+        build), None to parse them in the current process. The default is None
+    n_shards : int, optional
+        number of shards of the user files parsed by executor. The default is 16
+    users : list, optional
+        users to be added (in this order), None to add all the users of the category. The default is None
+    """
+    if executor is None:
+        return _build_shard(path_category, users)
+    if users is None:
+        users = list_category(path_category)
+    shard_size = max(1, -(-len(users) // n_shards))
+    shards = [users[i:i + shard_size] for i in range(0, len(users), shard_size)]
+    builder = NetworkBuilder()
+    for partial in executor.map(_build_shard, [path_category] * len(shards), shards):
+        builder.merge(partial)
+    return builder
+
+
+class SnapshotWriter:
+    """
+    writes the edges of each time window of window_days days in {folder}/{first day of the window}.csv (same
+    format of the complete edge list), appending them to the existing files
+    """
+
+    def __init__(self, folder, window_days, buffer_size=100000):
+        """
+        Parameters
+        ----------
+        folder : str
+            path of the snapshots folder, created if it does not exist
+        window_days : int
+            length in days of the time windows (e.g., 1 for daily snapshots)
+        buffer_size : int, optional
+            number of edges kept in memory before appending them to the files. The default is 100000
+        """
+        self.folder = folder
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self.window_days = window_days
+        self.buffer_size = buffer_size
+        self.windows = dict()  # date (%d/%m/%Y) -> snapshot filename
+        self.rows = dict()  # snapshot filename -> buffered rows
+        self.n_rows = 0
+
+    def filename(self, dt):
+        if dt not in self.windows:
+            day = datetime.datetime.strptime(dt, '%d/%m/%Y').date()
+            first_day = datetime.date.fromordinal(day.toordinal() - (day.toordinal() - 1) % self.window_days)
+            self.windows[dt] = f"{first_day.strftime('%Y-%m-%d')}.csv"
+        return self.windows[dt]
+
+    def add(self, dt, row):
+        self.rows.setdefault(self.filename(dt), []).append(row)
+        self.n_rows += 1
+        if self.n_rows >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        for filename, rows in self.rows.items():
+            with open(os.path.join(self.folder, filename), 'a') as out:
+                out.writelines(rows)
+        self.rows = dict()
+        self.n_rows = 0
+
+
+class IncrementalNetwork:
+    """
+    incremental build of the network of a category: only the users whose data grew since the last build are read
+    and only the new edges are appended to the edge list, including the pending edges (i.e., edges whose parent
+    was not found) resolved by the new data. The state is kept in state_folder: ID -> author index of the
+    category, comments already written and a JSON state (size of each user data and of each output file, pending
+    edges) rewritten atomically at the end of each update, so that the outputs of an interrupted update are
+    truncated at the next one.
+    """
+
+    def __init__(self, state_folder):
+        """
+        Parameters
+        ----------
+        state_folder : str
+            path of the folder with the state of the incremental build, created if it does not exist
+        """
+        self.state_folder = state_folder
+        if not os.path.exists(self.state_folder):
+            os.makedirs(self.state_folder)
+        self.state_filename = os.path.join(self.state_folder, 'state.json')
+        self.emitted_filename = os.path.join(self.state_folder, 'emitted_ids')
+        if os.path.exists(self.state_filename):
+            with open(self.state_filename) as fp:
+                self.state = json.load(fp)
+        else:
+            self.state = {'users': {}, 'files': {}, 'pending': []}
+
+    def __rollback(self, filenames):
+        # truncating the files written by an interrupted update to their committed size
+        for filename in filenames:
+            if os.path.exists(filename):
+                with open(filename, 'r+') as fp:
+                    fp.truncate(self.state['files'].get(filename, 0))
+
+    def update(self, path_category, filename, executor=None, n_shards=16, thing_index=None, snapshots=None):
+        """
+        Appends to filename the new edges of the category
+
+        Parameters
+        ----------
+        path_category : str
+            path of the category folder (user JSON files or SegmentStore)
+        filename : str
+            path of the edge list (i.e., {category}_complete.csv)
+        executor : concurrent.futures.Executor, optional
+            pool parsing the changed user files (see build_network). The default is None
+        n_shards : int, optional
+            number of shards of the changed user files parsed by executor. The default is 16
+        thing_index : ThingIndex, optional
+            index of all the extracted posts/comments used to resolve the parents not found in the category.
+            The default is None
+        snapshots : SnapshotWriter, optional
+            writer of the new edges split by time window. The default is None
+        returns the number of new edges and of pending edges
+        """
+        snapshot_files = list()
+        if snapshots is not None:
+            snapshot_files = [os.path.join(snapshots.folder, name) for name in os.listdir(snapshots.folder)]
+        self.__rollback([filename, self.emitted_filename] + snapshot_files)
+        emitted = SeenIndex(self.emitted_filename)
+        things = ThingIndex(os.path.join(self.state_folder, 'things.sqlite'))
+        try:
+            sizes = category_sizes(path_category)
+            changed = [user for user in list_category(path_category) if self.state['users'].get(user) != sizes[user]]
+            builder = build_network(path_category, executor, n_shards, users=changed)
+            things.add((builder.thing_id(key), builder.usernames[author], None)
+                       for key, author in builder.thing_authors.items())
+            for comment_id, parent_id, author, dt in self.state['pending']:
+                builder.add_edge(comment_id, parent_id, author, dt)
+            builder.resolve_parents(things)
+            if thing_index is not None:
+                builder.resolve_parents(thing_index)
+            n_edges = 0
+            with open(filename, 'a') as out:
+                for edge in builder.edges():
+                    comment_id = builder.thing_id(edge[0])
+                    if emitted.contains('comments', comment_id):
+                        continue
+                    row = builder.format_edge(edge)
+                    out.write(row)
+                    if snapshots is not None:
+                        snapshots.add(builder.dates[edge[4]], row)
+                    emitted.add('comments', comment_id)
+                    n_edges += 1
+            if snapshots is not None:
+                snapshots.flush()
+                snapshot_files = [os.path.join(snapshots.folder, name) for name in os.listdir(snapshots.folder)]
+            pending = dict()
+            for comment_id, parent_id, author, dt in builder.unresolved():
+                if not emitted.contains('comments', comment_id):
+                    pending[comment_id] = [comment_id, parent_id, author, dt]
+            emitted.commit()
+            self.state = {'users': sizes, 'pending': list(pending.values()),
+                          'files': {name: os.path.getsize(name)
+                                    for name in [filename, self.emitted_filename] + snapshot_files}}
+            tmp_filename = self.state_filename + '.tmp'
+            with open(tmp_filename, 'w') as fp:
+                json.dump(self.state, fp)
+            os.replace(tmp_filename, self.state_filename)
+        finally:
+            emitted.close()
+            things.close()
+        return n_edges, len(self.state['pending'])
+
+    def reset(self):
+        """
+        Removes the state (i.e., the next update rebuilds the whole network)
+        """
+        if os.path.exists(self.state_folder):
+            shutil.rmtree(self.state_folder)
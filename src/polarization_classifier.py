@@ -1,4 +1,6 @@
 import pickle
+import queue
+import threading
 import time
 import datetime
 import json
@@ -10,23 +12,28 @@ import re
 import stop_words
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from stop_words import get_stop_words
-from keras.models import model_from_json
-from keras.models import load_model
-from keras.preprocessing.text import Tokenizer
-from keras.preprocessing.sequence import pad_sequences
+from src.lstm_inference import NumpyLSTMModel, pad_post
+from src.prediction_cache import PredictionCache, file_fingerprint
+from src.run_manifest import RunManifest
+from src.text_encoder import TextEncoder
+
+_STOP_WORDS = None
 
 
 def remove_stopWords(s):
-    stop_words = get_stop_words('en')
-    s = ' '.join(word for word in s.split() if word not in stop_words)
+    global _STOP_WORDS
+    if _STOP_WORDS is None:
+        _STOP_WORDS = frozenset(get_stop_words('en'))
+    s = ' '.join(word for word in s.split() if word not in _STOP_WORDS)
     return s
 
 
 class PolarizationClassifier(object):
 
     def __init__(self, out_folder, extract_post, extract_comment, category, start_date, end_date, file_model,
-                 file_weights, file_tokenizer):
+                 file_weights=None, file_tokenizer=None, dynamic_padding=None, cache_file=None, cache_size=10000000):
         """
         Parameters
         ----------
@@ -42,12 +49,23 @@ class PolarizationClassifier(object):
             beginning date in format %d/%m/%Y
         end_date : str
             end date in format %d/%m/%Y
-        file_model: .json
-            Glove Word Embeddings + LSTM Model
+        file_model: .json or .npz
+            Glove Word Embeddings + LSTM Model, .npz for the model exported by lstm_inference.export_keras_model
+            (i.e., weights and tokenizer included, predicted with NumPy without keras/tensorflow)
         file_weights: .h5
-            Model's weights
+            Model's weights (not used with a .npz model)
         file_tokenizer: .pickle
-            Model's tokenizer
+            Model's tokenizer (not used with a .npz model)
+        dynamic_padding : bool, optional
+            True to predict the texts sorted by length, padding each batch only to its longest sequence (at most
+            350), False to pad all of them to 350. None to use it only if the model masks the padding (i.e.,
+            Embedding with mask_zero, otherwise the padding changes the predictions) and accepts sequences of any
+            length. The default is None
+        cache_file : str, optional
+            path of a persistent cache (SQLite) of the predictions, keyed by a hash of model, weights, tokenizer and
+            text: only the texts not in the cache are predicted. None to disable the cache. The default is None
+        cache_size : int, optional
+            maximum number of cached predictions, the least recently used ones are evicted. The default is 10000000
         """
 
         self.out_folder = out_folder
@@ -59,20 +77,57 @@ class PolarizationClassifier(object):
         # transforming date in a suitable format for folder name (category)
         self.pretty_start_date = start_date.replace('/', '-')
         self.pretty_end_date = end_date.replace('/', '-')
-        # loading model and weights
-        json_file = open(file_model, 'r')
-        loaded_model_json = json_file.read()
-        json_file.close()
-        self.model = model_from_json(loaded_model_json)
-        self.model.load_weights(file_weights)
-        # loading tokenizer
-        with open(file_tokenizer, 'rb') as handle:
-            self.tokenizer = pickle.load(handle)
-
-    def compute_polarization(self):
+        if file_model.endswith('.npz'):
+            # exported model: weights and tokenizer in the same file
+            self.model = NumpyLSTMModel(file_model)
+            self.tokenizer = self.model.tokenizer
+        else:
+            from keras.models import model_from_json
+            # loading model and weights
+            json_file = open(file_model, 'r')
+            loaded_model_json = json_file.read()
+            json_file.close()
+            self.model = model_from_json(loaded_model_json)
+            self.model.load_weights(file_weights)
+            # loading tokenizer
+            with open(file_tokenizer, 'rb') as handle:
+                self.tokenizer = pickle.load(handle)
+        # stop words removal and tokenization
+        self.encoder = TextEncoder(self.tokenizer)
+        if dynamic_padding is None:
+            dynamic_padding = self._masks_padding()
+        self.dynamic_padding = dynamic_padding
+        self.model_files = [filename for filename in (file_model, file_weights, file_tokenizer) if filename is not None]
+        self.cache = None
+        if cache_file is not None:
+            self.cache = PredictionCache(cache_file, file_fingerprint(*self.model_files), max_entries=cache_size)
+
+    def compute_polarization(self, batch_size=1024, memory_budget=256 * 1024 * 1024, n_readers=0, queue_size=64,
+                             incremental=False):
         """
         For each category, for each time period, for each user collcting their texts (posts/comments)
         (i.e., 'clean_text' field) and then computing his polarization score
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            number of texts predicted with a single model call: the texts of many users are gathered in the same
+            batches and the scores are scattered back to each user. The default is 1024
+        memory_budget : int, optional
+            maximum size in bytes of the texts collected before predicting them (the users collected so far are
+            scored together). The default is 256MB
+        n_readers : int, optional
+            number of threads reading and preprocessing the user files while the model predicts the users read
+            before them (see _score_period_pipelined), 0 to read, preprocess and predict in sequence. The default
+            is 0
+        queue_size : int, optional
+            maximum number of users read and not predicted yet with n_readers > 0 (the readers wait when the queue
+            is full). The default is 64
+        incremental : bool, optional
+            True to score only the users whose file is new or changed since the previous incremental run (see
+            RunManifest, stored in Polarization_scores/{category}/.{period}.manifest.json) and merge them with the
+            scores of the other users, False to score all of them. All the users are scored again if the model or
+            extract_post/extract_comment changed. The default is False
         """
         # creating folder with avg polaization score for each user
         user_polscore_folder = os.path.join(self.out_folder, 'Polarization_scores')
@@ -96,6 +151,9 @@ class PolarizationClassifier(object):
                     shutil.unpack_archive(file_name, extract_dir, 'zip')
                     unzipped_categories.append(unzipped_filename)
         print('unzipped:', unzipped_categories)
+        if incremental:
+            settings = {'extract_post': self.extract_post, 'extract_comment': self.extract_comment,
+                        'model': file_fingerprint(*self.model_files)}
 
         # collecting texts for each category,period,user
         for category in unzipped_categories:
@@ -110,31 +168,26 @@ class PolarizationClassifier(object):
                 path_period = os.path.join(path_category, period)
                 users_list = os.listdir(path_period)
                 users_pol = dict()
-                # collecting user texts 
-                for user in users_list:
-                    user_filename = os.path.join(path_period, user)
-                    texts = list()
-                    with open(user_filename, 'r') as f:
-                        user_data = json.load(f)
-                        if self.extract_comment:
-                            for comment in user_data['comments']:
-                                texts.append(comment['clean_text'])
-                        if self.extract_post:
-                            for post in user_data['posts']:
-                                texts.append(post['clean_text'])
-                    pretty_username = user.replace('.json', '')
-                    # computing polarization score for each user' content
-                    results = self._predict_prob(texts)
-                    pol_scores = [float(item) for sublist in results for item in sublist]
-                    user_avg_pol = round(statistics.mean(pol_scores), 2)
-                    # discretizing polarization scores in 3 category right, neutral, left
-                    if user_avg_pol >= 0.6:
-                        label = 'right'
-                    elif user_avg_pol <= 0.4:
-                        label = 'left'
-                    else:
-                        label = 'neutral'
-                    users_pol[pretty_username] = (user_avg_pol, label)
+                all_users = users_list
+                if incremental:
+                    manifest = RunManifest(os.path.join(polscore_category, f'.{period}.manifest.json'), settings)
+                    previous, users_list = manifest.split(path_period, all_users)
+                    print('unchanged users:', len(previous), 'users to score:', len(users_list))
+                if n_readers > 0:
+                    stats = self._score_period_pipelined(path_period, users_list, users_pol, batch_size,
+                                                         memory_budget, n_readers, queue_size)
+                    print('pipeline:', stats)
+                else:
+                    self._score_period(path_period, users_list, users_pol, batch_size, memory_budget)
+                if incremental:
+                    for user in users_list:
+                        manifest.record(user, users_pol[user.replace('.json', '')])
+                    # merging the scores of the unchanged users, in users_list order as in a complete run
+                    scored = users_pol
+                    users_pol = dict()
+                    for user in all_users:
+                        username = user.replace('.json', '')
+                        users_pol[username] = scored[username] if username in scored else previous[user]
                 nodes = list()
                 labels = list()
                 for user in users_pol:
@@ -149,6 +202,269 @@ class PolarizationClassifier(object):
                 period_filename = os.path.join(polscore_category, f'{period}.json')
                 with open(period_filename, 'w') as fp:
                     json.dump(users_pol, fp, sort_keys=True, indent=4)
+                if incremental:
+                    manifest.commit()
+        if self.cache is not None:
+            print('prediction cache:', self.cache.stats())
+
+    def _read_texts(self, user_filename):
+        texts = list()
+        with open(user_filename, 'r') as f:
+            user_data = json.load(f)
+            if self.extract_comment:
+                for comment in user_data['comments']:
+                    texts.append(comment['clean_text'])
+            if self.extract_post:
+                for post in user_data['posts']:
+                    texts.append(post['clean_text'])
+        return texts
+
+    def _score_period(self, path_period, users_list, users_pol, batch_size, memory_budget):
+        """
+        Scores the users of a period reading, preprocessing and predicting their texts in sequence (the users
+        collected until memory_budget are predicted together), adds their (avg_polarization_score, label) to
+        users_pol
+        """
+        # texts of the users collected so far, the texts of usernames[i] are texts[offsets[i]:offsets[i + 1]]
+        usernames, texts, offsets = list(), list(), [0]
+        texts_size = 0
+        # collecting user texts
+        for user in users_list:
+            user_filename = os.path.join(path_period, user)
+            user_texts = self._read_texts(user_filename)
+            usernames.append(user.replace('.json', ''))
+            texts.extend(user_texts)
+            offsets.append(len(texts))
+            texts_size += sum(len(text) for text in user_texts)
+            if texts_size >= memory_budget:
+                self._score_users(usernames, texts, offsets, users_pol, batch_size)
+                usernames, texts, offsets = list(), list(), [0]
+                texts_size = 0
+        self._score_users(usernames, texts, offsets, users_pol, batch_size)
+
+    def _score_users(self, usernames, texts, offsets, users_pol, batch_size):
+        """
+        Predicts the texts of a group of users in batches of batch_size texts and adds to users_pol the
+        (avg_polarization_score, label) of each user (the texts of usernames[i] are texts[offsets[i]:offsets[i + 1]])
+        """
+        self._assign_scores(usernames, self._predict_batches(texts, batch_size), offsets, users_pol)
+
+    def _score_period_pipelined(self, path_period, users_list, users_pol, batch_size, memory_budget, n_readers,
+                                queue_size):
+        """
+        Scores the users of a period with a pipeline: n_readers threads read and preprocess the user files (see
+        _preprocess) and put them in a queue of at most queue_size users, waiting when it is full, while this thread
+        predicts the queued users in groups of at least 4 * batch_size texts (the model and the cache are used only
+        by this thread). An error in a stage stops all of them and is raised here. Adds to users_pol the
+        (avg_polarization_score, label) of each user in users_list order
+        returns the counters of the stages (users, texts and busy/waiting seconds)
+        """
+        items = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'read': {'users': 0, 'texts': 0, 'seconds': 0.0, 'blocked_seconds': 0.0},
+                 'inference': {'users': 0, 'texts': 0, 'groups': 0, 'seconds': 0.0, 'idle_seconds': 0.0}}
+
+        def put(item):
+            # waiting for room in the queue (backpressure) unless the pipeline is stopping
+            start = time.time()
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            with lock:
+                stats['read']['blocked_seconds'] += time.time() - start
+
+        def read(users):
+            try:
+                for user in users:
+                    if stop.is_set():
+                        return
+                    start = time.time()
+                    texts = self._read_texts(os.path.join(path_period, user))
+                    cleaned, sequences = self._preprocess(texts)
+                    with lock:
+                        stats['read']['users'] += 1
+                        stats['read']['texts'] += len(texts)
+                        stats['read']['seconds'] += time.time() - start
+                    put((user.replace('.json', ''), cleaned, sequences, sum(len(text) for text in texts)))
+            except BaseException:
+                stop.set()
+                raise
+            finally:
+                # end of this reader
+                put(None)
+
+        scored = dict()
+        # users queued and not predicted yet, the texts of usernames[i] are sequences[offsets[i]:offsets[i + 1]]
+        group = {'usernames': list(), 'cleaned': list(), 'sequences': list(), 'offsets': [0], 'size': 0}
+
+        def predict_group():
+            start = time.time()
+            cleaned = group['cleaned'] if self.cache is not None else None
+            scores = self._predict_prepared(cleaned, group['sequences'], batch_size)
+            self._assign_scores(group['usernames'], scores, group['offsets'], scored)
+            stats['inference']['users'] += len(group['usernames'])
+            stats['inference']['texts'] += len(group['sequences'])
+            stats['inference']['groups'] += 1
+            stats['inference']['seconds'] += time.time() - start
+            group.update(usernames=list(), cleaned=list(), sequences=list(), offsets=[0], size=0)
+
+        with ThreadPoolExecutor(max_workers=n_readers) as executor:
+            readers = [executor.submit(read, users_list[i::n_readers]) for i in range(n_readers)]
+            try:
+                n_finished = 0
+                while n_finished < n_readers and not stop.is_set():
+                    start = time.time()
+                    try:
+                        item = items.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    finally:
+                        stats['inference']['idle_seconds'] += time.time() - start
+                    if item is None:
+                        n_finished += 1
+                        continue
+                    username, cleaned, sequences, size = item
+                    group['usernames'].append(username)
+                    if cleaned is not None:
+                        group['cleaned'].extend(cleaned)
+                    group['sequences'].extend(sequences)
+                    group['offsets'].append(len(group['sequences']))
+                    group['size'] += size
+                    if len(group['sequences']) >= 4 * batch_size or group['size'] >= memory_budget:
+                        predict_group()
+                if not stop.is_set() and group['usernames']:
+                    predict_group()
+            finally:
+                stop.set()
+            # errors of the readers
+            for reader in readers:
+                reader.result()
+        for user in users_list:
+            username = user.replace('.json', '')
+            users_pol[username] = scored[username]
+        for stage in stats.values():
+            stage['texts_per_second'] = round(stage['texts'] / stage['seconds'], 1) if stage['seconds'] else 0.0
+            for counter in stage:
+                if counter.endswith('seconds'):
+                    stage[counter] = round(stage[counter], 3)
+        return stats
+
+    def _assign_scores(self, usernames, scores, offsets, users_pol):
+        """
+        Adds to users_pol the (avg_polarization_score, label) of each user from the scores of their texts (the
+        scores of usernames[i] are scores[offsets[i]:offsets[i + 1]])
+        """
+        for i, username in enumerate(usernames):
+            # computing polarization score for each user' content
+            pol_scores = scores[offsets[i]:offsets[i + 1]].tolist()
+            user_avg_pol = round(statistics.mean(pol_scores), 2)
+            # discretizing polarization scores in 3 category right, neutral, left
+            if user_avg_pol >= 0.6:
+                label = 'right'
+            elif user_avg_pol <= 0.4:
+                label = 'left'
+            else:
+                label = 'neutral'
+            users_pol[username] = (user_avg_pol, label)
+
+    def _masks_padding(self):
+        """
+        True if the batches can be padded to their longest sequence: the Embedding layer of the model masks the
+        padding value (0) and the model accepts sequences of any length
+        """
+        if isinstance(self.model, NumpyLSTMModel):
+            masks_zero = self.model.mask_zero
+            input_length = None
+        else:
+            masks_zero = any(layer.__class__.__name__ == 'Embedding' and layer.get_config().get('mask_zero', False)
+                             for layer in self.model.layers)
+            try:
+                input_length = self.model.input_shape[1]
+            except (AttributeError, IndexError, TypeError, ValueError):  # input shape not defined
+                input_length = None
+        if input_length is not None:
+            print(f'Dynamic padding disabled: the model accepts only sequences of {input_length} tokens')
+            return False
+        if not masks_zero:
+            print('Dynamic padding disabled: the Embedding layer of the model does not mask the padding (mask_zero), '
+                  'all the texts are padded to 350 tokens')
+            return False
+        return True
+
+    def _predict_batches(self, submissions, batch_size):
+        """
+        returns a flat array with the prediction/polarization score of each sentence, predicted in batches of
+        batch_size sentences (only the sentences not in the cache, if any)
+        """
+        if self.cache is None:
+            return self._predict_sequences(self.encoder.texts_to_sequences(submissions), batch_size)
+        # remove stop words
+        submissions = [self.encoder.remove_stop_words(x) for x in submissions]
+        return self._predict_cached(submissions, None, batch_size)
+
+    def _preprocess(self, texts):
+        """
+        returns the texts without stop words (None without the prediction cache, i.e., they are not needed) and
+        their token IDs, to be predicted by _predict_prepared
+        """
+        if self.cache is None:
+            return None, self.encoder.texts_to_sequences(texts)
+        cleaned = [self.encoder.remove_stop_words(text) for text in texts]
+        return cleaned, self.encoder.texts_to_sequences(cleaned)
+
+    def _predict_prepared(self, cleaned, sequences, batch_size):
+        """
+        returns a flat array with the prediction of each sentence preprocessed by _preprocess
+        """
+        if cleaned is None:
+            return self._predict_sequences(sequences, batch_size)
+        return self._predict_cached(cleaned, sequences, batch_size)
+
+    def _predict_cached(self, submissions, sequences, batch_size):
+        """
+        returns a flat array with the prediction of each sentence without stop words, predicting only the ones not
+        in the cache (sequences: token IDs of the sentences, None to tokenize only the ones to predict)
+        """
+        keys = [self.cache.key(x) for x in submissions]
+        scores = self.cache.get_many(keys)
+        # predicting once each sentence not in the cache
+        missing = dict()
+        for i, key in enumerate(keys):
+            if key not in scores and key not in missing:
+                missing[key] = i
+        if missing:
+            if sequences is None:
+                missing_sequences = self.encoder.texts_to_sequences([submissions[i] for i in missing.values()])
+            else:
+                missing_sequences = [sequences[i] for i in missing.values()]
+            missing_scores = self._predict_sequences(missing_sequences, batch_size)
+            missing_scores = dict(zip(missing, missing_scores.tolist()))
+            self.cache.put_many(missing_scores)
+            scores.update(missing_scores)
+        return np.array([scores[key] for key in keys], dtype=np.float64)
+
+    def _predict_sequences(self, sequences, batch_size):
+        """
+        returns a flat array with the prediction of each tokenized sentence, predicted in batches of batch_size
+        """
+        if not self.dynamic_padding:
+            results = [np.asarray(self.model.predict_proba(pad_post(sequences[i:i + batch_size], maxlen=350)),
+                                  dtype=np.float64).reshape(-1) for i in range(0, len(sequences), batch_size)]
+            return np.concatenate(results) if results else np.zeros(0)
+        # batches of sequences of similar length, each padded to its longest sequence
+        order = np.argsort([min(len(sequence), 350) for sequence in sequences], kind='stable')
+        scores = np.zeros(len(sequences))
+        for i in range(0, len(order), batch_size):
+            batch = order[i:i + batch_size]
+            batch_sequences = [sequences[j] for j in batch]
+            maxlen = max(1, min(350, max(len(sequence) for sequence in batch_sequences)))
+            padded = pad_post(batch_sequences, maxlen=maxlen)
+            scores[batch] = np.asarray(self.model.predict_proba(padded), dtype=np.float64).reshape(-1)
+        return scores
 
     def _predict_prob(self, submissions):
         """
@@ -157,12 +473,8 @@ class PolarizationClassifier(object):
 
         :param submissions:
         """
-        # remove stop words
-        submissions = [remove_stopWords(x) for x in submissions]
-        # tokenize and vectorize sequences
-        encoded_docs_test = self.tokenizer.texts_to_sequences(submissions)
-        # padding sequences
-        padded_docs_test = pad_sequences(encoded_docs_test, maxlen=350, padding='post')
+        # tokenized and padded sequences
+        padded_docs_test = self.encoder.encode(submissions, maxlen=350)
         return self.model.predict_proba(padded_docs_test)
 
     def _predict_class(self, submissions):
@@ -0,0 +1,107 @@
+import hashlib
+import sqlite3
+import time
+
+
+def file_fingerprint(*filenames):
+    """
+    returns the SHA-256 hex digest of the content of one or more files (e.g., model, weights and tokenizer)
+    """
+    digest = hashlib.sha256()
+    for filename in filenames:
+        with open(filename, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    persistent cache (SQLite) of the prediction of each text, keyed by a hash of the model fingerprint and of the
+    preprocessed text (i.e., a new model or tokenizer never reuses old scores); the least recently used entries
+    are evicted when the cache exceeds max_entries
+    """
+
+    # maximum number of keys in a single lookup query (i.e., SQLite limit on the query parameters)
+    CHUNK_SIZE = 900
+    # fraction of max_entries evicted at once when the cache exceeds it (i.e., no eviction at every insert once full)
+    EVICT_FRACTION = 0.1
+
+    def __init__(self, filename, fingerprint, max_entries=10000000):
+        """
+        Parameters
+        ----------
+        filename : str
+            path of the SQLite database, created if it does not exist
+        fingerprint : str
+            fingerprint of model, weights and tokenizer (see file_fingerprint)
+        max_entries : int, optional
+            maximum number of cached predictions. The default is 10000000
+        """
+        self.filename = filename
+        self.fingerprint = fingerprint.encode('utf-8')
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS scores '
+                                '(key BLOB PRIMARY KEY, score REAL, last_used REAL) WITHOUT ROWID')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)')
+        # running number of entries, counted once at the opening
+        self.n_entries = self.connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+    def key(self, text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16, key=self.fingerprint[:64]).digest()
+
+    def get_many(self, keys):
+        """
+        returns a dict {key: score} of the keys found in the cache, marking them as recently used
+        """
+        keys = list(dict.fromkeys(keys))
+        found = dict()
+        for i in range(0, len(keys), self.CHUNK_SIZE):
+            chunk = keys[i:i + self.CHUNK_SIZE]
+            query = f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(chunk))})"
+            for key, score in self.connection.execute(query, chunk):
+                found[key] = score
+        if found:
+            # a single transaction, one statement per chunk of hits
+            now = time.time()
+            hits = list(found)
+            with self.connection:
+                for i in range(0, len(hits), self.CHUNK_SIZE):
+                    chunk = hits[i:i + self.CHUNK_SIZE]
+                    self.connection.execute(f"UPDATE scores SET last_used = ? WHERE key IN "
+                                            f"({','.join('?' * len(chunk))})", [now] + chunk)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores):
+        """
+        Adds a dict {key: score} to the cache, evicting the least recently used entries beyond max_entries
+        """
+        now = time.time()
+        with self.connection:
+            total_changes = self.connection.total_changes
+            self.connection.executemany('INSERT OR IGNORE INTO scores VALUES (?, ?, ?)',
+                                        ((key, float(score), now) for key, score in scores.items()))
+            added = self.connection.total_changes - total_changes
+            if added < len(scores):
+                # some keys were already cached
+                self.connection.executemany('UPDATE scores SET score = ?, last_used = ? WHERE key = ?',
+                                            ((float(score), now, key) for key, score in scores.items()))
+            self.n_entries += added
+            if self.n_entries > self.max_entries:
+                n_evicted = self.n_entries - int(self.max_entries * (1 - self.EVICT_FRACTION))
+                cursor = self.connection.execute('DELETE FROM scores WHERE key IN '
+                                                 '(SELECT key FROM scores ORDER BY last_used LIMIT ?)', (n_evicted,))
+                self.n_entries -= cursor.rowcount
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': self.n_entries}
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,188 @@
+import json
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # optional dependency, faster JSON decoding of the responses
+    orjson = None
+
+
+def _decode(content):
+    """
+    Decodes the JSON bytes of a response, with orjson when available
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError as e:
+            raise json.decoder.JSONDecodeError(str(e), '', 0)
+    return json.loads(content)
+
+
+class PushshiftAPIError(Exception):
+    """
+    raised when a request to pushshift.io fails after all the allowed retries
+    """
+
+
+class TokenBucket:
+    """
+    token-bucket rate limiter shared by all the threads using the same client
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Parameters
+        ----------
+        rate : float
+            tokens (i.e., requests) added to the bucket each second
+        capacity : int
+            maximum number of tokens in the bucket (i.e., maximum burst of requests)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available and consumes it
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PushshiftClient:
+    """
+    HTTP transport layer for pushshift.io: keep-alive connection pooling, rate limiting and bounded retries with
+    exponential backoff and jitter
+    """
+
+    BASE_URL = 'https://api.pushshift.io/reddit/search/'
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, requests_per_second=1.0, burst=5, max_retries=8, backoff_base=1.0, backoff_max=60.0,
+                 pool_size=16, timeout=60):
+        """
+        Parameters
+        ----------
+        requests_per_second : float, optional
+            average number of requests per second allowed. The default is 1.0
+        burst : int, optional
+            maximum number of requests sent back to back. The default is 5
+        max_retries : int, optional
+            maximum number of retries of a failing request. The default is 8
+        backoff_base : float, optional
+            seconds waited before the first retry, doubled at each following retry. The default is 1.0
+        backoff_max : float, optional
+            maximum seconds waited between two retries. The default is 60.0
+        pool_size : int, optional
+            maximum number of kept-alive connections. The default is 16
+        timeout : float, optional
+            seconds waited for the server response. The default is 60
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(requests_per_second, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # counters
+        self._lock = threading.Lock()
+        self.n_requests = 0
+        self.n_retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.bytes_received = 0
+
+    def __backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before the given retry attempt: exponential backoff with full jitter, or the server
+        Retry-After header when present
+        """
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def __record(self, latency, retry, n_bytes=0):
+        with self._lock:
+            self.n_requests += 1
+            self.bytes_received += n_bytes
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if retry:
+                self.n_retries += 1
+
+    def search(self, endpoint, params):
+        """
+        API REQUEST to pushshift.io/reddit/search/{endpoint} (i.e., 'submission' or 'comment')
+        returns the list of dictionaries in the 'data' field of the response, params can contain a 'fields'
+        projection (i.e., comma separated fields returned for each record) to reduce the response size
+        """
+        return self.__get(endpoint, params)['data']
+
+    def count(self, endpoint, params):
+        """
+        API REQUEST to pushshift.io/reddit/search/{endpoint} asking only for the metadata
+        returns the number of records matching params, None if the API does not return it
+        """
+        params = dict(params, size=0, metadata='true')
+        params.pop('fields', None)
+        metadata = self.__get(endpoint, params).get('metadata') or {}
+        total_results = metadata.get('total_results')
+        return int(total_results) if total_results is not None else None
+
+    def __get(self, endpoint, params):
+        url = self.BASE_URL + endpoint
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            begin = time.monotonic()
+            retry_after = None
+            try:
+                r = self.session.get(url, params=params, timeout=self.timeout)  # Response Object
+                if r.status_code in self.RETRY_STATUS:
+                    retry_after = r.headers.get('Retry-After')
+                    error = f'HTTP {r.status_code}'
+                else:
+                    r.raise_for_status()
+                    data = _decode(r.content)  # r.content is a JSON object, converted into dict
+                    self.__record(time.monotonic() - begin, attempt > 0, len(r.content))
+                    return data
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout, json.decoder.JSONDecodeError) as e:
+                error = repr(e)
+            self.__record(time.monotonic() - begin, attempt > 0)
+            if attempt < self.max_retries:
+                time.sleep(self.__backoff(attempt, retry_after))
+        raise PushshiftAPIError(f'{url} {params} failed after {self.max_retries} retries: {error}')
+
+    def stats(self):
+        """
+        returns a dict with the number of requests, the number of retries, the average/maximum latency
+        (in seconds) and the bytes received of the requests sent so far
+        """
+        with self._lock:
+            return {'n_requests': self.n_requests,
+                    'n_retries': self.n_retries,
+                    'avg_latency': self.total_latency / self.n_requests if self.n_requests else 0.0,
+                    'max_latency': self.max_latency,
+                    'bytes_received': self.bytes_received}
@@ -2,58 +2,46 @@ import datetime
 from datetime import date
 from dateutil.relativedelta import relativedelta
 import time
-import requests
 import json
-import random
 import os
 import os.path
 import shutil
-import zipfile
-import string
-import glob
-import re
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, ProcessPoolExecutor
+from src.pushshift_client import PushshiftClient
+from src.text_cleaning import clean_raw_text
+from src.checkpoint import CheckpointManifest
+from src.segment_store import SegmentStore
+from src.columnar_store import ColumnarWriter
+from src.seen_index import SeenIndex
+from src.user_spool import UserSpool
+from src.unit_spool import UnitSpool
+from src.network_builder import build_network, IncrementalNetwork, SnapshotWriter
+from src.thing_index import ThingIndex
+from src.graph_store import build_graph, read_edge_list, write_graph
+from src.graph_analytics import write_metrics
+from src.thread_index import ThreadIndex
 
 __author__ = "Virginia Morini"
 
 
-def clean_raw_text(text):
-    """
-    Clean raw post/comment text with standard preprocessing pipeline
-    """
-    # Lowercasing text
-    text = text.lower()
-    # Removing not printable characters
-    text = ''.join(filter(lambda x: x in string.printable, text))
-    # Removing XSLT tags
-    text = re.sub(r'&lt;/?[a-z]+&gt;', '', text)
-    text = text.replace(r'&amp;', 'and')
-    text = text.replace(r'&gt;', '')
-    # Removing newline, tabs and special reddit words
-    text = text.replace('\n', ' ')
-    text = text.replace('\t', ' ')
-    text = text.replace('[deleted]', '').replace('[removed]', '')
-    # Removing URLs
-    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
-    # Removing numbers
-    text = re.sub(r'\w*\d+\w*', '', text)
-    # Removing Punctuation
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    # Removing extra spaces
-    text = re.sub(r'\s{2,}', " ", text)
-    # Stop words? Emoji?
-    return text
-
-
 class RedditHandler:
     """
     class responsible for extracting and processing reddit data and the creation of users' network
     """
 
+    # maximum number of records of the work units waiting for the previous ones to be saved kept in memory by the
+    # concurrent extraction, the next ones are spooled to disk
+    UNIT_MEMORY_RECORDS = 200000
+
     def __init__(self, out_folder, extract_post, extract_comment,
                  post_attributes=('id', 'author', 'created_utc', 'num_comments', 'over_18', 'is_self', 'score',
                                   'selftext', 'stickied', 'subreddit', 'subreddit_id', 'title'),
                  comment_attributes=('id', 'author', 'created_utc', 'link_id', 'parent_id', 'subreddit', 'subreddit_id',
-                                     'body', 'score')):
+                                     'body', 'score'), client=None, dump_reader=None, storage='json',
+                 columnar_folder=None, seen_index_capacity=None, adaptive_windows=False, window_records=5000,
+                 thing_index=True):
         """
         Parameters
         ----------
@@ -69,6 +57,32 @@ class RedditHandler:
         comment_attributes : list, optional
             comment's attributes to be selected. The default is ['id', 'author', 'created_utc', 'link_id',
             'parent_id', 'subreddit', 'subreddit_id', 'body', 'score']
+        client : PushshiftClient, optional
+            HTTP client used for all the API requests, None to use a PushshiftClient with default settings.
+            The default is None
+        dump_reader : PushshiftDumpReader, optional
+            reader of local Pushshift monthly dumps used as data source instead of the API, None to use the API.
+            The default is None
+        storage : str, optional
+            'json' to save the data of each category as one JSON file for each user, 'segments' to append them to
+            the segment files of a SegmentStore (compacted at the end of the extraction). The default is 'json'
+        columnar_folder : str, optional
+            path of a folder where extracted posts and comments are also written as Parquet files partitioned by
+            category, kind and day, None to disable the columnar output. The default is None
+        seen_index_capacity : int, optional
+            expected number of records of a category to keep the IDs already saved in a Bloom filter, None to keep
+            them in an exact set (it cannot change between runs on the same out_folder). The default is None
+        adaptive_windows : bool, optional
+            True to plan the periodical extraction on the number of records of each time window (counted by the
+            API): empty windows are skipped with a single request and windows with more than window_records
+            records are split in halves. False to move the cursor of one day each time the API returns no data.
+            The default is False
+        window_records : int, optional
+            maximum number of records of a window paginated without splitting it. The default is 5000
+        thing_index : bool, optional
+            True to record the ID, author and created_utc of each extracted post/comment in a persistent index
+            (Categories_raw_data/.things.sqlite), used by create_network to resolve parents extracted in other
+            time windows or categories. The default is True
         """
 
         self.out_folder = out_folder
@@ -78,72 +92,64 @@ class RedditHandler:
         self.extract_comment = extract_comment
         self.post_attributes = post_attributes
         self.comment_attributes = comment_attributes
+        # fields requested to the API: selected attributes and fields needed to process posts/comments (the
+        # comments of the periodical extraction are saved with the post's attributes)
+        self.post_fields = ','.join(sorted(set(post_attributes) | {'id', 'author', 'created_utc', 'title',
+                                                                  'selftext'}))
+        self.comment_fields = ','.join(sorted(set(comment_attributes) | set(post_attributes) |
+                                              {'id', 'author', 'created_utc', 'body', 'link_id', 'parent_id'}))
+        self.client = client if client is not None else PushshiftClient()
+        self.dump_reader = dump_reader
+        if storage not in ('json', 'segments'):
+            raise ValueError(f'Unknown storage {storage}, it has to be json or segments')
+        self.storage = storage
+        self.seen_index_capacity = seen_index_capacity
+        self.adaptive_windows = adaptive_windows
+        self.window_records = window_records
+        self.thing_index = thing_index
+        self.columnar_writer = None
+        if columnar_folder is not None:
+            self.columnar_writer = ColumnarWriter(columnar_folder, post_attributes, comment_attributes)
 
     def __post_request_API_periodical(self, start_date, end_date, subreddit):
         """
         API REQUEST to pushishift.io/reddit/submission
-        returns a list of 1000 dictionaries where each of them is a post
+        returns a list of 500 dictionaries where each of them is a post
         """
-        url = 'https://api.pushshift.io/reddit/search/submission?&size=500&after=' + str(start_date) + '&before=' + str(
-            end_date) + '&subreddit=' + str(subreddit)
-        try:
-            r = requests.get(url)  # Response Object
-            # time.sleep(random.random() * 0.02)
-            data = json.loads(r.text)  # r.text is a JSON object, converted into dict
-        except (requests.exceptions.ConnectionError, json.decoder.JSONDecodeError,
-                requests.exceptions.ChunkedEncodingError):
-            return self.__post_request_API_periodical(start_date, end_date, subreddit)
-        return data['data']  # data['data'] contains list of posts
+        return self.client.search('submission', {'size': 500, 'after': start_date, 'before': end_date,
+                                                 'subreddit': subreddit, 'fields': self.post_fields})
 
     def __post_request_API_user(self, start_date, end_date, username):
         """
         API REQUEST to pushishift.io/reddit/submission
-        returns a list of 1000 dictionaries where each of them is a post
+        returns a list of 500 dictionaries where each of them is a post
         """
-        url = 'https://api.pushshift.io/reddit/search/submission?&size=500&after=' + str(start_date) + '&before=' + str(
-            end_date) + '&author=' + str(username)
-        try:
-            r = requests.get(url)  # Response Object
-            # time.sleep(random.random() * 0.02)
-            data = json.loads(r.text)  # r.text is a JSON object, converted into dict
-        except (requests.exceptions.ConnectionError, json.decoder.JSONDecodeError,
-                requests.exceptions.ChunkedEncodingError):
-            return self.__post_request_API_user(start_date, end_date, username)
-        return data['data']  # data['data'] contains list of posts
+        return self.client.search('submission', {'size': 500, 'after': start_date, 'before': end_date,
+                                                 'author': username, 'fields': self.post_fields})
 
     def __comment_request_API_periodical(self, start_date, end_date, subreddit):
         """
         API REQUEST to pushishift.io/reddit/comment
-        returns a list of 1000 dictionaries where each of them is a comment
+        returns a list of 500 dictionaries where each of them is a comment
         """
-        url = 'https://api.pushshift.io/reddit/search/comment?&size=500&after=' + str(start_date) + '&before=' + str(
-            end_date) + '&subreddit=' + str(subreddit)
-        print(url)
-        try:
-            r = requests.get(url)  # Response Object
-            # time.sleep(random.random() * 0.02)
-            data = json.loads(r.text)  # r.text is a JSON object, converted into dict
-        except (requests.exceptions.ConnectionError, json.decoder.JSONDecodeError,
-                requests.exceptions.ChunkedEncodingError):
-            print("err")
-            return self.__comment_request_API_periodical(start_date, end_date, subreddit)
-        return data['data']  # data['data'] contains list of comments
+        return self.client.search('comment', {'size': 500, 'after': start_date, 'before': end_date,
+                                              'subreddit': subreddit, 'fields': self.comment_fields})
 
     def __comment_request_API_user(self, start_date, end_date, username):
         """
         API REQUEST to pushishift.io/reddit/comment
-        returns a list of 1000 dictionaries where each of them is a comment
+        returns a list of 500 dictionaries where each of them is a comment
         """
-        url = 'https://api.pushshift.io/reddit/search/comment?&size=500&after=' + str(start_date) + '&before=' + str(
-            end_date) + '&author=' + str(username)
-        try:
-            r = requests.get(url)  # Response Object
-            # time.sleep(random.random() * 0.02)
-            data = json.loads(r.text)  # r.text is a JSON object, converted into dict
-        except (requests.exceptions.ConnectionError, json.decoder.JSONDecodeError,
-                requests.exceptions.ChunkedEncodingError):
-            return self.__comment_request_API_user(start_date, end_date, username)
-        return data['data']  # data['data'] contains list of comments
+        return self.client.search('comment', {'size': 500, 'after': start_date, 'before': end_date,
+                                              'author': username, 'fields': self.comment_fields})
+
+    def __count_API_periodical(self, kind, start_date, end_date, subreddit):
+        """
+        API REQUEST to pushishift.io/reddit/submission or pushishift.io/reddit/comment
+        returns the number of posts/comments (kind) of a subreddit between start_date and end_date
+        """
+        return self.client.count('submission' if kind == 'posts' else 'comment',
+                                 {'after': start_date, 'before': end_date, 'subreddit': subreddit})
 
     def __write_data(self, users, path):
         pass
@@ -202,7 +208,177 @@ class RedditHandler:
                 with open(user_filename, 'w') as fp:
                     json.dump(users[user], fp, sort_keys=True, indent=4)
 
-    def extract_periodical_data(self, start_date, end_date, categories):
+    def __periodical_pages(self, kind, start_date, end_date, subreddit):
+        """
+        Generator over the API pages of a subreddit between start_date and end_date (UNIX timestamps),
+        each page is a list of raw posts (kind='posts') or raw comments (kind='comments')
+        """
+        if self.dump_reader is not None:
+            yield from self.dump_reader.pages(kind, start_date, end_date, subreddit=subreddit)
+            return
+        if kind == 'posts':
+            request_API = self.__post_request_API_periodical
+        else:
+            request_API = self.__comment_request_API_periodical
+        if self.adaptive_windows:
+            windows = self.__plan_windows(kind, start_date, end_date, subreddit)
+        else:
+            windows = [(start_date, end_date, None)]
+        for after, before, n_records in windows:
+            if n_records is None:
+                yield from self.__day_by_day_pages(request_API, after, before, subreddit)
+                continue
+            # the number of records is an estimate, used only to plan the windows: paginating until the API
+            # returns no more records of the window
+            current_date = after
+            while True:
+                page = request_API(current_date, before, subreddit)
+                if len(page) == 0:
+                    break
+                yield page
+                current_date = page[-1]['created_utc']
+
+    def __plan_windows(self, kind, start_date, end_date, subreddit):
+        """
+        Generator over the (after, before, n_records) windows of start_date-end_date, in chronological order,
+        containing at most window_records records: empty windows are skipped and bigger windows are split in
+        halves (n_records is None when the API does not return the number of records)
+        """
+        stack = [(start_date, end_date)]
+        while stack:
+            after, before = stack.pop()
+            n_records = self.__count_API_periodical(kind, after, before, subreddit)
+            if n_records == 0:
+                continue
+            if n_records is None or n_records <= self.window_records or before - after <= 2:
+                yield after, before, n_records
+                continue
+            middle = (after + before) // 2
+            # 'after' and 'before' are exclusive: the second half starts one second earlier
+            stack.append((middle - 1, before))
+            stack.append((after, middle))
+
+    @staticmethod
+    def __day_by_day_pages(request_API, start_date, end_date, subreddit):
+        """
+        Generator over the API pages of a subreddit, moving the cursor of one day when a page is empty
+        """
+        current_date = start_date
+        while current_date <= end_date:
+            page = request_API(current_date, end_date, subreddit)
+            if len(page) == 0:
+                # no data in the current day: moving the cursor to the following day
+                current_date = datetime.datetime.utcfromtimestamp(current_date).strftime("%d/%m/%Y")
+                current_date = datetime.datetime.strptime(current_date, "%d/%m/%Y") + relativedelta(days=+1)
+                current_date = int((current_date - datetime.datetime(1970, 1, 1)).total_seconds())
+                continue
+            yield page
+            # taking the UNIX timestamp date of the last record extracted
+            current_date = page[-1]['created_utc']
+
+    def __user_pages(self, kind, start_date, end_date, username):
+        """
+        Generator over the API pages of a user between start_date and end_date (UNIX timestamps),
+        each page is a list of raw posts (kind='posts') or raw comments (kind='comments')
+        """
+        if self.dump_reader is not None:
+            yield from self.dump_reader.pages(kind, start_date, end_date, author=username)
+            return
+        if kind == 'posts':
+            request_API = self.__post_request_API_user
+        else:
+            request_API = self.__comment_request_API_user
+        page = request_API(start_date, end_date, username)
+        while len(page) > 0:  # collecting data until reaching the end_date
+            yield page
+            # taking the UNIX timestamp date of the last record extracted
+            page = request_API(page[-1]['created_utc'], end_date, username)
+
+    def __extract_window(self, category, subreddit, kind, start_date, end_date, flush, seen=None):
+        """
+        Extracts posts or comments (kind) of a subreddit between start_date and end_date (UNIX timestamps),
+        calling flush(users, cursor) with a dict {user: {'posts': {date: [...]}, 'comments': {date: [...]}}} each
+        time the extraction moves to a new day, where cursor is the created_utc up to which the window is extracted.
+        Records already in the SeenIndex seen, or in the previous page, are skipped before being processed.
+        """
+        is_post = kind == 'posts'
+        users = dict()
+        old_current = start_date
+        previous_ids = set()
+        for page in self.__periodical_pages(kind, start_date, end_date, subreddit):
+            page_ids = set()
+            for raw_post in page:
+
+                if raw_post['author'] in ['[deleted]', 'AutoModerator']:
+                    continue
+
+                # skipping records fetched twice at a page boundary or already saved
+                if raw_post['id'] in previous_ids or raw_post['id'] in page_ids or \
+                        (seen is not None and seen.contains_committed(kind, raw_post['id'])):
+                    continue
+                page_ids.add(raw_post['id'])
+
+                user, pdescr, _ = self.__process_post(raw_post, category, is_post=is_post)
+
+                if user not in users:
+                    users[user] = {'posts': {}, 'comments': {}}
+                if pdescr['date'] in users[user][kind]:
+                    users[user][kind][pdescr['date']].append(pdescr)
+                else:
+                    users[user][kind][pdescr['date']] = [pdescr]
+            previous_ids = page_ids
+
+            pretty_current_date = datetime.datetime.utcfromtimestamp(page[-1]['created_utc']).strftime('%Y-%m-%d')
+
+            if pretty_current_date != old_current:
+                print(f'Extracted {kind} until date: {pretty_current_date}')
+                old_current = pretty_current_date
+                flush(users, page[-1]['created_utc'])
+                users = dict()
+        flush(users, end_date - 1)
+
+    @staticmethod
+    def __time_shards(start_date, end_date, shard_days):
+        """
+        Splits [start_date, end_date] (UNIX timestamps) in consecutive windows of shard_days days, returned as
+        (after, before) pairs such that every timestamp belongs to exactly one window
+        """
+        if not shard_days:
+            return [(start_date, end_date)]
+        shards = list()
+        shard_size = int(shard_days * 24 * 60 * 60)
+        after = start_date
+        while after + shard_size < end_date:
+            shards.append((after, after + shard_size))
+            # 'after' is exclusive and 'before' is exclusive: the next window starts one second earlier
+            after = after + shard_size - 1
+        shards.append((after, end_date))
+        return shards
+
+    def extract_periodical_data(self, start_date, end_date, categories, n_workers=1, shard_days=None, resume=False):
+        """
+        extract data (i.e., posts and/or comments) of one or more categories of subreddits in a time period and
+        saves them, for each category, in a folder containing one JSON file for each user
+
+        Parameters
+        ----------
+        start_date : str
+            beginning date in format %d/%m/%Y
+        end_date : str
+            end date in format %d/%m/%Y
+        categories : dict
+            dict with arbitrary category name as key and list of subreddits in that category as value
+        n_workers : int, optional
+            number of work units (i.e., category, subreddit, kind, time shard) extracted concurrently.
+            The default is 1 (sequential extraction)
+        shard_days : int, optional
+            length in days of the time shards in which the period is split, None to use a single shard.
+            The default is None
+        resume : bool, optional
+            True to continue each (category, subreddit, kind) from the last created_utc cursor committed in the
+            checkpoint manifest by a previous run over the same period, False to extract the whole period (and
+            forget the cursors of the period). The default is False
+        """
 
         # converting date from format %d/%m/%Y to UNIX timestamp as requested by API
         start_date = int(time.mktime(datetime.datetime.strptime(start_date, "%d/%m/%Y").timetuple()))
@@ -211,107 +387,139 @@ class RedditHandler:
         if not os.path.exists(raw_data_folder):
             os.mkdir(raw_data_folder)
 
-        for category, subcats in categories.items():
-            for sub in subcats:
-
-                current_date_post = start_date
-
-                if self.extract_post:
-                    end_flag = True
-                    users = dict()
-                    old_current = current_date_post
-                    while end_flag:
-
-                        if current_date_post > end_date:
-                            end_flag = False
-                            path_category = self.__check_path(category, raw_data_folder)
-                            self.__save_data(users, path_category)
-                            continue
-
-                        posts = self.__post_request_API_periodical(current_date_post, end_date, sub)
-
-                        if len(posts) == 0:
-                            current_date_post = datetime.datetime.utcfromtimestamp(current_date_post).strftime(
-                                "%d/%m/%Y")
-                            current_date_post = datetime.datetime.strptime(current_date_post, "%d/%m/%Y") + \
-                                                relativedelta(days=+1)
-                            current_date_post = int((current_date_post - datetime.datetime(1970, 1, 1)).total_seconds())
-                            continue
-
-                        for raw_post in posts:
-
-                            if raw_post['author'] in ['[deleted]', 'AutoModerator']:
-                                continue
-
-                            user, pdescr, current_date_post = self.__process_post(raw_post, category, is_post=True)
-
-                            if user in users:
-
-                                if pdescr['date'] in users[user]['posts']:
-                                    users[user]['posts'][pdescr['date']].append(pdescr)
-                                else:
-                                    users[user]['posts'][pdescr['date']] = [pdescr]
-                            else:
-                                users[user] = {'posts': {pdescr['date']: [pdescr]}, 'comments': {}}
-
-                        pretty_current_date_post = datetime.datetime.utcfromtimestamp(current_date_post).strftime(
-                            '%Y-%m-%d')
-
-                        if pretty_current_date_post != old_current:
-                            print(f'Extracted posts until date: {pretty_current_date_post}')
-                            old_current = pretty_current_date_post
-                            path_category = self.__check_path(category, raw_data_folder)
-                            self.__save_data(users, path_category)
-                            users = dict()
-
-                if self.extract_comment:
-                    current_date_post = start_date
-
-                    end_flag = True
-                    users = dict()
-                    old_current = current_date_post
-                    while end_flag:
-
-                        if current_date_post > end_date:
-                            end_flag = False
-                            path_category = self.__check_path(category, raw_data_folder)
-                            self.__save_data(users, path_category)
-                            continue
-
-                        posts = self.__comment_request_API_periodical(current_date_post, end_date, sub)
-
-                        if len(posts) == 0:
-                            current_date_post = datetime.datetime.utcfromtimestamp(current_date_post).strftime(
-                                "%d/%m/%Y")
-                            current_date_post = datetime.datetime.strptime(current_date_post, "%d/%m/%Y") + \
-                                                relativedelta(days=+1)
-                            current_date_post = int((current_date_post - datetime.datetime(1970, 1, 1)).total_seconds())
-                            continue
-
-                        for raw_post in posts:
-
-                            if raw_post['author'] in ['[deleted]', 'AutoModerator']:
-                                continue
-
-                            user, pdescr, current_date_post = self.__process_post(raw_post, category, is_post=False)
-
-                            if user in users:
-                                if pdescr['date'] in users[user]['comments']:
-                                    users[user]['comments'][pdescr['date']].append(pdescr)
-                                else:
-                                    users[user]['comments'][pdescr['date']] = [pdescr]
-                            else:
-                                users[user] = {'posts': {}, 'comments': {pdescr['date']: [pdescr]}}
-
-                        pretty_current_date_post = datetime.datetime.utcfromtimestamp(current_date_post).strftime(
-                            '%Y-%m-%d')
+        kinds = list()
+        if self.extract_post:
+            kinds.append('posts')
+        if self.extract_comment:
+            kinds.append('comments')
+        shards = self.__time_shards(start_date, end_date, shard_days)
+        # work units in the same order as the sequential extraction
+        units = [(category, sub, kind, after, before) for category, subcats in categories.items()
+                 for sub in subcats for kind in kinds for after, before in shards]
+
+        # checkpoint manifest with a created_utc cursor for each (category, subreddit, kind, period): a cursor
+        # committed by a run over another period never skips records of this one
+        manifest = CheckpointManifest(os.path.join(raw_data_folder, '.checkpoint.json'))
+        if resume:
+            resumed_units = list()
+            for category, sub, kind, after, before in units:
+                cursor = manifest.get(manifest.key(category, sub, kind, start_date, end_date))
+                if cursor is not None:
+                    after = max(after, cursor)
+                if after < before - 1:  # skipping windows already extracted
+                    resumed_units.append((category, sub, kind, after, before))
+            units = resumed_units
+        else:
+            manifest.commit_many({manifest.key(*unit[:3], start_date, end_date): None for unit in units})
+
+        stores = dict()  # category -> SegmentStore
+        # ID -> author index of all the extracted posts/comments, shared by the categories
+        things = None
+        # category -> index of the IDs already saved
+        seen_indexes = dict()
+        completed = False
+        try:
+            if self.dump_reader is not None:
+                # each monthly dump is decompressed once for all the subreddits and time shards of the units
+                for kind in kinds:
+                    subreddits = {unit[1] for unit in units if unit[2] == kind}
+                    if subreddits:
+                        self.dump_reader.extract_subreddits(kind, start_date, end_date, subreddits)
+
+            if self.thing_index:
+                things = ThingIndex(os.path.join(raw_data_folder, '.things.sqlite'))
+            for category in categories:
+                seen_indexes[category] = SeenIndex(os.path.join(self.__check_path(category, raw_data_folder),
+                                                                '.seen_ids'), expected_items=self.seen_index_capacity)
+
+            def save(unit, users, cursor):
+                path_category = self.__check_path(unit[0], raw_data_folder)
+                users = self.__drop_seen(users, seen_indexes[unit[0]])
+                if self.storage == 'segments':
+                    if unit[0] not in stores:
+                        stores[unit[0]] = SegmentStore(path_category)
+                    stores[unit[0]].append(users)
+                else:
+                    self.__save_data(users, path_category)
+                if self.columnar_writer is not None:
+                    self.columnar_writer.write(unit[0], users)
+                if things is not None:
+                    things.add_users(users)
+                seen_indexes[unit[0]].commit()
+                manifest.commit(manifest.key(*unit[:3], start_date, end_date), cursor)
+
+            if n_workers <= 1:
+                for unit in units:
+                    self.__extract_window(*unit, lambda users, cursor: save(unit, users, cursor),
+                                          seen=seen_indexes[unit[0]])
+            else:
+                # flushes of each unit, saved in units order (i.e., same files as the sequential path): the flushes of
+                # the first unfinished unit are saved as they arrive, the ones of the next units are kept in memory or
+                # spooled to disk until their turn
+                stop = threading.Event()
+                with tempfile.TemporaryDirectory(dir=raw_data_folder, prefix='.units_') as spool_folder:
+                    spool = UnitSpool(spool_folder, len(units), self.UNIT_MEMORY_RECORDS)
+
+                    def flush_unit(i, users, cursor):
+                        if stop.is_set():
+                            raise CancelledError()
+                        spool.put(i, users, cursor)
+
+                    def run_unit(i):
+                        try:
+                            self.__extract_window(*units[i], lambda users, cursor: flush_unit(i, users, cursor),
+                                                  seen=seen_indexes[units[i][0]])
+                        finally:
+                            # end of the unit (also after an error, raised by its future)
+                            spool.finish(i)
+
+                    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                        futures = [executor.submit(run_unit, i) for i in range(len(units))]
+                        try:
+                            for i, (unit, future) in enumerate(zip(units, futures)):
+                                for users, cursor in spool.flushes(i):
+                                    save(unit, users, cursor)
+                                future.result()
+                        finally:
+                            # after an error: the pending units are cancelled and the running ones stop at their next
+                            # flush
+                            stop.set()
+                            for future in futures:
+                                future.cancel()
+            completed = True
+        finally:
+            # also after an error: the saved data are compacted and the indexes closed
+            for store in stores.values():
+                store.compact()
+            for seen in seen_indexes.values():
+                if not completed:
+                    # IDs of the records of a flush interrupted before being saved
+                    seen.rollback()
+                seen.close()
+            if things is not None:
+                things.close()
+            if self.dump_reader is not None:
+                self.dump_reader.clear_extracts()
 
-                        if pretty_current_date_post != old_current:
-                            print(f'Extracted comments until date: {pretty_current_date_post}')
-                            old_current = pretty_current_date_post
-                            path_category = self.__check_path(category, raw_data_folder)
-                            self.__save_data(users, path_category)
-                            users = dict()
+    @staticmethod
+    def __drop_seen(users, seen):
+        """
+        returns users without the records already in the SeenIndex seen, adding the other ones to it
+        """
+        new_users = dict()
+        for user in users:
+            for kind in ('posts', 'comments'):
+                for dt, records in users[user][kind].items():
+                    new_records = list()
+                    for record in records:
+                        if not seen.contains(kind, record['id']):
+                            seen.add(kind, record['id'])
+                            new_records.append(record)
+                    if new_records:
+                        if user not in new_users:
+                            new_users[user] = {'posts': {}, 'comments': {}}
+                        new_users[user][kind][dt] = new_records
+        return new_users
 
     @staticmethod
     def __check_path(category, raw_data_folder):
@@ -322,7 +530,8 @@ class RedditHandler:
 
         return path_category
 
-    def extract_user_data(self, users_list, start_date=None, end_date=None):
+    def extract_user_data(self, users_list, start_date=None, end_date=None, resume=False, n_workers=1,
+                          authors_per_request=1, memory_budget=256 * 1024 * 1024):
         """
         extract data (i.e., posts and/or comments) of one or more Reddit users
 
@@ -335,6 +544,17 @@ class RedditHandler:
             (i.e., 23/06/2005)
         end_date : str
             end date in format %d/%m/%Y, None if you want end extracting data at today date
+        resume : bool, optional
+            True to continue each (user, kind) from the last created_utc cursor committed in the checkpoint
+            manifest by a previous run (only if the period extracted by the previous runs starts before start_date
+            and reaches it), False to extract the whole period. The default is False
+        n_workers : int, optional
+            number of groups of users extracted concurrently. The default is 1
+        authors_per_request : int, optional
+            number of users queried together with a single author=a,b,c request. The default is 1
+        memory_budget : int, optional
+            maximum size in bytes of the records kept in memory (shared among the workers), the records
+            exceeding it are streamed to a spool file of each user. The default is 256MB
 
         """
         # creating folder to record user activities
@@ -350,95 +570,174 @@ class RedditHandler:
         # converting date from format %d/%m/%Y to UNIX timestamp as requested by API
         start_date = int(time.mktime(datetime.datetime.strptime(start_date, "%d/%m/%Y").timetuple()))
         end_date = int(time.mktime(datetime.datetime.strptime(end_date, "%d/%m/%Y").timetuple()))
-        users = dict()
-        for username in users_list:
-            print("Begin data extraction for user:", username)
-            current_date_post = start_date
-            current_date_comment = start_date
-            # extracting posts
-            if self.extract_post:
-                old_current = ""
-                posts = self.__post_request_API_user(current_date_post, end_date,
-                                                     username)  # first call to API # TODO change API
-                while len(posts) > 0:  # collecting data until reaching the end_date
-                    # TODO: check if sub exists!
-                    for raw_post in posts:
-                        user_id = raw_post['author']
-                        if user_id not in users.keys():
-                            if self.extract_post and self.extract_comment:
-                                users[user_id] = {'posts': [], 'comments': []}
-                            else:
-                                users[user_id] = {'posts': []}
-                        post = dict()  # dict to store posts
-                        # adding field date in a readable format
-                        post['date'] = datetime.datetime.utcfromtimestamp(raw_post['created_utc']).strftime("%d/%m/%Y")
-                        # cleaning body field
-                        try:
-                            merged_text = raw_post['title'] + ' ' + raw_post['selftext']
-                        except:
-                            merged_text = raw_post['title']
-                        post['clean_text'] = clean_raw_text(merged_text)
-                        # selecting fields 
-                        for attr in self.post_attributes:
-                            if attr not in raw_post.keys():  # handling missing values
-                                post[attr] = None
-                            elif (attr != 'selftext') and (attr != 'title'):  # saving only clean text
-                                post[attr] = raw_post[attr]
-                        users[user_id]['posts'].append(post)
-                    current_date_post = posts[-1][
-                        'created_utc']  # taking the UNIX timestamp date of the last record extracted
-                    posts = self.__post_request_API_user(current_date_post, end_date, username)
-                    pretty_current_date_post = datetime.datetime.utcfromtimestamp(current_date_post).strftime(
-                        '%Y-%m-%d')
-                    if pretty_current_date_post != old_current:
-                        print(f'Extracted posts until date: {pretty_current_date_post}')
-                        old_current = pretty_current_date_post
-
-            # extracting comments
-            if self.extract_comment:
-                old_current = ""
-                comments = self.__comment_request_API_user(current_date_comment, end_date,
-                                                           username)  # first call to API
-                while len(comments) > 0:
-                    for raw_comment in comments:
-                        user_id = raw_comment['author']
-                        if user_id not in users.keys():
-                            if self.extract_post and self.extract_comment:
-                                users[user_id] = {'posts': [], 'comments': []}
-                            else:
-                                users[user_id] = {'comments': []}
-                        comment = dict()  # dict to store a comment
-                        # adding field date in a readable format
-                        comment['date'] = datetime.datetime.utcfromtimestamp(raw_comment['created_utc']).strftime(
-                            "%d/%m/%Y")
-                        # cleaning body field
-                        comment['clean_text'] = clean_raw_text(raw_comment['body'])
-                        # selecting fields
-                        for attr in self.comment_attributes:
-                            if attr not in raw_comment.keys():  # handling missing values
-                                comment[attr] = None
-                            elif attr != 'body':  # saving only clean text
-                                comment[attr] = raw_comment[attr]
-                        users[user_id]['comments'].append(comment)
-                    current_date_comment = comments[-1][
-                        'created_utc']  # taking the UNIX timestamp date of the last record extracted
-                    comments = self.__comment_request_API_user(current_date_comment, end_date, username)
-                    pretty_current_date_comment = datetime.datetime.utcfromtimestamp(current_date_comment).strftime(
-                        '%Y-%m-%d')
-                    if pretty_current_date_comment != old_current:
-                        print(f'Extracted comments until date: {pretty_current_date_comment}')
-                        old_current = pretty_current_date_comment
-
-            print('Finish data extraction for user:', username)
-
-        # saving data: for each user a json file
-        for user in users:
-            user_filename = os.path.join(raw_data_folder, f'{user}.json')
-            with open(user_filename, 'w') as fp:
-                json.dump(users[user], fp, sort_keys=True, indent=4)
+        # checkpoint manifest with a created_utc cursor for each (user, kind) and the committed spool size
+        manifest = CheckpointManifest(os.path.join(raw_data_folder, '.checkpoint.json'))
+        groups = [users_list[i:i + authors_per_request] for i in range(0, len(users_list), authors_per_request)]
+        budget = max(1, memory_budget // max(1, n_workers))
+
+        def run_group(group):
+            self.__extract_users_group(group, start_date, end_date, resume, manifest, raw_data_folder, budget)
+
+        if n_workers <= 1:
+            for group in groups:
+                run_group(group)
+        else:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                for _ in executor.map(run_group, groups):
+                    pass
         print('Done to extract data for all selected users', users_list)
 
-    def create_network(self, categories):
+    def __user_record(self, raw, kind):
+        """
+        Builds the record saved in the user JSON file from a raw post (kind='posts') or comment (kind='comments')
+        """
+        record = dict()
+        # adding field date in a readable format
+        record['date'] = datetime.datetime.utcfromtimestamp(raw['created_utc']).strftime("%d/%m/%Y")
+        if kind == 'posts':
+            # cleaning body field
+            try:
+                merged_text = raw['title'] + ' ' + raw['selftext']
+            except:
+                merged_text = raw['title']
+            record['clean_text'] = clean_raw_text(merged_text)
+            # selecting fields
+            for attr in self.post_attributes:
+                if attr not in raw.keys():  # handling missing values
+                    record[attr] = None
+                elif (attr != 'selftext') and (attr != 'title'):  # saving only clean text
+                    record[attr] = raw[attr]
+        else:
+            # cleaning body field
+            record['clean_text'] = clean_raw_text(raw['body'])
+            # selecting fields
+            for attr in self.comment_attributes:
+                if attr not in raw.keys():  # handling missing values
+                    record[attr] = None
+                elif attr != 'body':  # saving only clean text
+                    record[attr] = raw[attr]
+        return record
+
+    def __extract_users_group(self, group, start_date, end_date, resume, manifest, raw_data_folder, memory_budget):
+        """
+        Extracts the data of a group of users, requesting their posts/comments together (i.e., author=a,b,c)
+        and streaming the records to the users' spool files, committed together with the cursors
+        """
+        kinds = [kind for kind, extract in (('posts', self.extract_post), ('comments', self.extract_comment))
+                 if extract]
+        spool = UserSpool(raw_data_folder, memory_budget, kinds)
+        cursors = dict()  # (username, kind) -> records with created_utc <= cursor are already in the spool
+        # username -> beginning of the period covered by the spool (i.e., from start to the cursors)
+        starts = dict()
+        active = list()
+        for username in group:
+            committed = {kind: manifest.get(manifest.key(username, kind)) for kind in kinds}
+            spool_size = manifest.get(manifest.key(username, 'spool'))
+            start = manifest.get(manifest.key(username, 'start'))
+            # the cursors are valid only if the period extracted so far contains start_date
+            contiguous = start is not None and start <= start_date and all(
+                cursor is None or cursor >= start_date - 1 for cursor in committed.values())
+            if not resume or not contiguous or all(cursor is None for cursor in committed.values()):
+                spool.remove(username)
+                committed = dict.fromkeys(kinds, None)
+                start = start_date
+                manifest.commit_many({manifest.key(username, key): None for key in kinds + ['spool', 'start']})
+            elif spool_size is not None:
+                # extraction interrupted: dropping the records spooled after the last commit
+                spool.truncate(username, spool_size)
+            elif all(cursor is not None and cursor >= end_date - 1 for cursor in committed.values()):
+                print('Data already extracted for user:', username)
+                continue
+            else:
+                # extending a previous extraction: the spool starts with the records already saved
+                spool.remove(username)
+                user_file = manifest.get(manifest.key(username, 'file')) or f'{username}.json'
+                if os.path.exists(os.path.join(raw_data_folder, user_file)):
+                    spool.seed(os.path.join(raw_data_folder, user_file), username)
+            for kind in kinds:
+                cursors[(username, kind)] = start_date if committed[kind] is None else max(start_date, committed[kind])
+            starts[username] = start
+            active.append(username)
+        if not active:
+            return
+        print("Begin data extraction for users:", ', '.join(active))
+        names = {username.lower(): username for username in active}
+        for kind in kinds:
+            kind_users = [username for username in active if cursors[(username, kind)] < end_date - 1]
+            if not kind_users:
+                continue
+            old_current = ""
+            current_date = min(cursors[(username, kind)] for username in kind_users)
+            for page in self.__user_pages(kind, current_date, end_date, ','.join(kind_users)):
+                for raw in page:
+                    username = names.get(str(raw['author']).lower())
+                    # skipping records of other users and records already spooled before a resume
+                    if username is None or raw['created_utc'] <= cursors[(username, kind)]:
+                        continue
+                    spool.add(username, kind, self.__user_record(raw, kind))
+                current_date = page[-1]['created_utc']  # taking the UNIX timestamp date of the last record extracted
+                if spool.is_full():
+                    self.__commit_spool(spool, manifest, active, kind_users, kind, current_date, cursors, starts)
+                pretty_current_date = datetime.datetime.utcfromtimestamp(current_date).strftime('%Y-%m-%d')
+                if pretty_current_date != old_current:
+                    print(f'Extracted {kind} until date: {pretty_current_date}')
+                    old_current = pretty_current_date
+            self.__commit_spool(spool, manifest, active, kind_users, kind, end_date - 1, cursors, starts)
+        # saving data: for each user a json file, written from its spool
+        for username in active:
+            user_file = spool.finish(username)
+            manifest.commit_many({manifest.key(username, 'spool'): None, manifest.key(username, 'file'): user_file})
+            spool.remove(username)
+        print('Finish data extraction for users:', ', '.join(active))
+
+    @staticmethod
+    def __commit_spool(spool, manifest, active, kind_users, kind, current_date, cursors, starts):
+        # the spooled records and the cursors reached are committed together
+        spool.flush()
+        committed = {manifest.key(username, 'spool'): spool.spool_size(username) for username in active}
+        committed.update({manifest.key(username, 'start'): starts[username] for username in active})
+        for username in kind_users:
+            cursors[(username, kind)] = max(cursors[(username, kind)], current_date)
+            committed[manifest.key(username, kind)] = cursors[(username, kind)]
+        manifest.commit_many(committed)
+
+    def create_network(self, categories, use_thing_index=True, n_workers=1, incremental=False, snapshot_days=None,
+                       weighted=False, metrics=False, threads=False):
+        """
+        creates the users' interaction network of each category (i.e., an edge from the author of each comment
+        to the author of its parent) and saves it in Categories_networks/{category}_complete.csv
+
+        Parameters
+        ----------
+        categories : dict
+            dict with arbitrary category name as key and list of subreddits in that category as value
+        use_thing_index : bool, optional
+            True to resolve the parents not found in the category with the persistent index of the extracted
+            posts/comments (if it exists), False to keep only the edges resolved inside the category.
+            The default is True
+        n_workers : int, optional
+            number of processes parsing disjoint shards of the user files of each category, merged in order
+            (i.e., same network of the sequential build). The default is 1
+        incremental : bool, optional
+            True to read only the user files changed since the last incremental build and append only the new
+            edges (including the ones whose parent was found in the new data), False to rebuild the whole network.
+            The default is False
+        snapshot_days : int, optional
+            length in days of the time windows of the snapshot edge lists written in
+            Categories_networks/{category}_snapshots (e.g., 1 for daily snapshots), None to write only the
+            complete edge list. The default is None
+        weighted : bool, optional
+            True to also write the weighted network (i.e., one edge for each pair of users with number of
+            interactions, first and last date) as {category}_weighted.csv, {category}_nodes.csv and the binary
+            CSR adjacency {category}_graph.npz (see graph_store.load_graph). The default is False
+        metrics : bool, optional
+            True to compute degrees, weighted degrees, connected components, PageRank and reciprocity of the
+            network ({category}_metrics.csv and {category}_summary.json) and, with snapshot_days, of each
+            snapshot (in Categories_networks/{category}_snapshots_metrics). The default is False
+        threads : bool, optional
+            True to also rebuild the reply trees of the category from link_id/parent_id and save them as a
+            ThreadIndex in {category}_threads.npz. The default is False
+        """
 
         if not self.extract_comment or not self.extract_post:
             raise ValueError('To create users interactions Networks you have to set self.extract_comment to True')
@@ -447,37 +746,69 @@ class RedditHandler:
         if not os.path.exists(user_network_folder):
             os.mkdir(user_network_folder)
         path = os.path.join(self.out_folder, 'Categories_raw_data')
+        things = None
+        if use_thing_index and os.path.exists(os.path.join(path, '.things.sqlite')):
+            things = ThingIndex(os.path.join(path, '.things.sqlite'))
 
-        for category in categories:
-            post_to_author = {}
-
-            users_path = os.path.join(path, category)
-
-            users_files = glob.glob(f"{users_path}{os.sep}*.json")
-            with open(os.path.join(user_network_folder, f"{category}.csv"), "w") as out:
-                for user_file in users_files:
-                    with open(user_file) as fp:
-                        data = json.loads(fp.read())
-                        for dt, comments in data['comments'].items():
-                            for comment in comments:
-                                res = f"{comment['id']},{comment['parent_id'].split('_')[1]},{comment['author']},,{dt}\n"
-                                post_to_author[comment['id']] = comment['author']
-                                out.write(res)
-                        for _, posts in data['posts'].items():
-                            for post in posts:
-                                post_to_author[post['id']] = post['author']
-
-            with open(os.path.join(user_network_folder, f"{category}.csv")) as f:
-                with open(os.path.join(user_network_folder, f"{category}_complete.csv"), "w") as out:
-                    for row in f:
-                        row = row.split(",")
-                        try:
-                            tid = post_to_author[row[1]]
-                            res = f"{row[0]},{row[1]},{row[2]},{tid},{row[4]}"
-                            out.write(res)
-                        except:
-                            pass
-            os.remove(os.path.join(user_network_folder, f"{category}.csv"))
+        executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+        try:
+            for category in categories:
+                users_path = os.path.join(path, category)
+                if threads:
+                    thread_index = ThreadIndex.build(users_path)
+                    thread_index.save(os.path.join(user_network_folder, f"{category}_threads.npz"))
+                    print(f'Threads of category {category}: {len(thread_index.thread_ptr) - 1} threads, '
+                          f'{len(thread_index.ids)} posts/comments')
+                network_filename = os.path.join(user_network_folder, f"{category}_complete.csv")
+                state = IncrementalNetwork(os.path.join(user_network_folder, f".{category}_state"))
+                snapshots = None
+                if snapshot_days is not None:
+                    snapshots_folder = os.path.join(user_network_folder, f"{category}_snapshots")
+                    if not incremental and os.path.exists(snapshots_folder):
+                        shutil.rmtree(snapshots_folder)
+                    snapshots = SnapshotWriter(snapshots_folder, snapshot_days)
+                if incremental:
+                    n_edges, n_pending = state.update(users_path, network_filename, executor, 4 * n_workers,
+                                                      things, snapshots)
+                    print(f'Network of category {category}: {n_edges} new edges, {n_pending} pending '
+                          f'(parent not found)')
+                    if weighted or metrics:
+                        # the weighted network aggregates the whole edge list
+                        self.__write_graph(user_network_folder, category, build_graph(*read_edge_list(
+                            network_filename)), weighted, metrics, snapshots)
+                    continue
+                state.reset()
+                # single pass over the user files, parent authors are resolved in memory
+                builder = build_network(users_path, executor, n_shards=4 * n_workers)
+                if things is not None:
+                    builder.resolve_parents(things)
+                n_edges, n_dropped = builder.write_csv(network_filename, snapshots)
+                print(f'Network of category {category}: {n_edges} edges, {n_dropped} dropped (parent not found)')
+                if weighted or metrics:
+                    self.__write_graph(user_network_folder, category, build_graph(*builder.interactions()),
+                                       weighted, metrics, snapshots)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if things is not None:
+                things.close()
+
+    @staticmethod
+    def __write_graph(user_network_folder, category, graph, weighted, metrics, snapshots):
+        if weighted:
+            write_graph(os.path.join(user_network_folder, category), graph)
+        if metrics:
+            summary = write_metrics(os.path.join(user_network_folder, category), graph)
+            print(f"Network of category {category}: {summary['n_nodes']} users, reciprocity "
+                  f"{summary['reciprocity']:.3f}, {summary['n_weak_components']} components")
+            if snapshots is not None:
+                # metrics of each time window
+                metrics_folder = os.path.join(user_network_folder, f"{category}_snapshots_metrics")
+                if not os.path.exists(metrics_folder):
+                    os.mkdir(metrics_folder)
+                for snapshot in sorted(os.listdir(snapshots.folder)):
+                    snapshot_graph = build_graph(*read_edge_list(os.path.join(snapshots.folder, snapshot)))
+                    write_metrics(os.path.join(metrics_folder, snapshot[:-len('.csv')]), snapshot_graph)
 
 
 if __name__ == '__main__':
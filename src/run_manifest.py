@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+from src.prediction_cache import file_fingerprint
+
+
+class RunManifest:
+    """
+    JSON manifest of the user files of a period processed by an incremental run (e.g., polarization scores or text
+    statistics): size, mtime and SHA-256 of each input file with the output computed from it, and the settings of
+    the run (e.g., model fingerprint), rewritten atomically. A file is recomputed only if it is new or its content
+    changed; all of them are recomputed if the settings changed
+    """
+
+    def __init__(self, filename, settings):
+        """
+        Parameters
+        ----------
+        filename : str
+            path of the JSON manifest, created at the first commit if it does not exist
+        settings : dict
+            settings the outputs depend on (JSON serializable), the recorded outputs are discarded if they differ
+            from the ones of the previous run
+        """
+        self.filename = filename
+        self.settings = settings
+        self.files = dict()
+        if os.path.exists(filename):
+            with open(filename) as fp:
+                manifest = json.load(fp)
+            if manifest['settings'] == json.loads(json.dumps(settings)):
+                self.files = manifest['files']
+        # signature of the files to recompute, taken before reading them
+        self._pending = dict()
+
+    @staticmethod
+    def _signature(filename):
+        stat = os.stat(filename)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def split(self, folder, filenames):
+        """
+        Compares the files of a folder with the manifest (the content hash is computed only if the mtime changed
+        and the size did not), forgetting the files no longer in filenames
+        returns a dict {filename: recorded output} of the unchanged files and the list of the new or changed ones,
+        in filenames order
+        """
+        unchanged = dict()
+        changed = list()
+        files = dict()
+        for name in filenames:
+            signature = self._signature(os.path.join(folder, name))
+            entry = self.files.get(name)
+            if entry is not None and entry['size'] == signature['size']:
+                if entry['mtime_ns'] != signature['mtime_ns']:
+                    # touched, same size: unchanged if the content is the same
+                    signature['hash'] = file_fingerprint(os.path.join(folder, name))
+                    if signature['hash'] == entry['hash']:
+                        entry['mtime_ns'] = signature['mtime_ns']
+                if entry['mtime_ns'] == signature['mtime_ns']:
+                    unchanged[name] = entry['output']
+                    files[name] = entry
+                    continue
+            signature.setdefault('hash', file_fingerprint(os.path.join(folder, name)))
+            self._pending[name] = signature
+            changed.append(name)
+        self.files = files
+        return unchanged, changed
+
+    def record(self, name, output):
+        """
+        Records the output computed from a new or changed file (see split)
+        """
+        self.files[name] = dict(self._pending.pop(name), output=output)
+
+    def commit(self):
+        """
+        Rewrites the manifest atomically (i.e., temporary file + rename, a crash leaves either the old or the new
+        manifest): to be called after writing the outputs, so a crash before it recomputes the files recorded
+        """
+        folder = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp_filename = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump({'settings': self.settings, 'files': self.files}, fp, sort_keys=True)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_filename, self.filename)
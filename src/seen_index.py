@@ -0,0 +1,132 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+
+class SeenIndex:
+    """
+    persistent index of the post/comment IDs already saved for a category, used to save each record exactly once.
+    IDs are kept in an exact set (persisted as an append-only log) or, when expected_items is given, in a
+    memory-mapped Bloom filter of fixed size. IDs added after the last commit are kept apart, so that a crash
+    never marks as saved a record which was not written.
+    """
+
+    # header of the Bloom filter file: magic number, number of bits and of hash functions
+    BLOOM_HEADER = struct.Struct('<8sQQ')
+    BLOOM_MAGIC = b'SEENBLM1'
+
+    def __init__(self, filename, expected_items=None, error_rate=1e-6):
+        """
+        Parameters
+        ----------
+        filename : str
+            path of the index file (a '.bloom' suffix is added for the Bloom filter)
+        expected_items : int, optional
+            expected number of IDs to use a Bloom filter, None to use an exact set. The default is None.
+            The size of the filter is stored in its file: a ValueError is raised if an existing filter was
+            created with other expected_items or error_rate
+        error_rate : float, optional
+            false positive rate of the Bloom filter (i.e., fraction of new records wrongly discarded).
+            The default is 1e-6
+        """
+        self.pending = set()
+        if expected_items is None:
+            self.filename = filename
+            self.bloom = None
+            self.ids = set()
+            if os.path.exists(self.filename):
+                with open(self.filename) as fp:
+                    for row in fp:
+                        kind, _, thing_id = row.rstrip('\n').partition(' ')
+                        if thing_id:
+                            self.ids.add(self.__int_key(kind, thing_id))
+        else:
+            self.filename = filename + '.bloom'
+            self.ids = None
+            # optimal number of bits and of hash functions for the expected items and error rate
+            self.n_bits = int(math.ceil(-expected_items * math.log(error_rate) / math.log(2) ** 2))
+            self.n_hashes = max(1, int(round(self.n_bits / expected_items * math.log(2))))
+            header = self.BLOOM_HEADER.pack(self.BLOOM_MAGIC, self.n_bits, self.n_hashes)
+            n_bytes = len(header) + (self.n_bits + 7) // 8
+            if not os.path.exists(self.filename):
+                with open(self.filename, 'wb') as fp:
+                    fp.write(header)
+                    fp.truncate(n_bytes)
+            self._fp = open(self.filename, 'r+b')
+            stored = self._fp.read(len(header))
+            if stored != header or os.path.getsize(self.filename) != n_bytes:
+                self._fp.close()
+                if stored == header:
+                    raise ValueError(f'{self.filename} does not have the size stored in its header')
+                if len(stored) == len(header) and stored.startswith(self.BLOOM_MAGIC):
+                    _, n_bits, n_hashes = self.BLOOM_HEADER.unpack(stored)
+                    raise ValueError(f'{self.filename} is a Bloom filter of {n_bits} bits and {n_hashes} hash '
+                                     f'functions, not {self.n_bits} and {self.n_hashes}: expected_items and '
+                                     f'error_rate have to be the ones it was created with')
+                raise ValueError(f'{self.filename} is not a valid Bloom filter file')
+            self.bloom = mmap.mmap(self._fp.fileno(), n_bytes)
+            self._offset = len(header)
+
+    @staticmethod
+    def __int_key(kind, thing_id):
+        # reddit IDs are base 36 integers, one bit distinguishes posts from comments
+        return int(thing_id, 36) * 2 + (kind == 'comments')
+
+    def __bits(self, kind, thing_id):
+        digest = hashlib.blake2b(f'{kind}_{thing_id}'.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def __committed(self, kind, thing_id):
+        if self.bloom is None:
+            return self.__int_key(kind, thing_id) in self.ids
+        return all(self.bloom[self._offset + (bit >> 3)] & (1 << (bit & 7)) for bit in self.__bits(kind, thing_id))
+
+    def contains(self, kind, thing_id):
+        """
+        True if the post (kind='posts') or comment (kind='comments') thing_id was already added
+        """
+        return (kind, thing_id) in self.pending or self.__committed(kind, thing_id)
+
+    def contains_committed(self, kind, thing_id):
+        """
+        True if the post/comment thing_id was saved in a previous commit (i.e., read-only check, safe to be done
+        from worker threads)
+        """
+        return self.__committed(kind, thing_id)
+
+    def add(self, kind, thing_id):
+        self.pending.add((kind, thing_id))
+
+    def commit(self):
+        """
+        Persists the IDs added since the last commit
+        """
+        if not self.pending:
+            return
+        if self.bloom is None:
+            with open(self.filename, 'a') as fp:
+                for kind, thing_id in self.pending:
+                    fp.write(f'{kind} {thing_id}\n')
+                    self.ids.add(self.__int_key(kind, thing_id))
+        else:
+            for kind, thing_id in self.pending:
+                for bit in self.__bits(kind, thing_id):
+                    self.bloom[self._offset + (bit >> 3)] |= 1 << (bit & 7)
+            self.bloom.flush()
+        self.pending = set()
+
+    def rollback(self):
+        """
+        Forgets the IDs added since the last commit (i.e., records which were not saved)
+        """
+        self.pending = set()
+
+    def close(self):
+        self.commit()
+        if self.bloom is not None:
+            self.bloom.close()
+            self._fp.close()
@@ -0,0 +1,195 @@
+import json
+import os
+import glob
+
+
+class SegmentStore:
+    """
+    append-only storage of the extracted data of a category: each flush appends one compact JSON line per user
+    to the current segment file and one entry per line to the index (user -> segment, offset, length), without
+    reading back what is already stored. compact() rewrites the segments with a single line for each user.
+    """
+
+    INDEX_FILENAME = 'segments.index'
+
+    def __init__(self, folder, segment_size=256 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+        folder : str
+            path of the category folder containing segments and index
+        segment_size : int, optional
+            size in bytes after which a new segment file is started. The default is 256MB
+        """
+        self.folder = folder
+        if not os.path.exists(self.folder):
+            os.mkdir(self.folder)
+        self.segment_size = segment_size
+        self.index = dict()  # user -> list of [segment, offset, length]
+        index_filename = os.path.join(self.folder, self.INDEX_FILENAME)
+        if os.path.exists(index_filename):
+            self.__load_index(index_filename)
+        segments = sorted(glob.glob(os.path.join(self.folder, 'segment_*.jsonl')))
+        self._n_segments = int(os.path.basename(segments[-1])[8:-6]) + 1 if segments else 0
+
+    def __load_index(self, index_filename):
+        """
+        Loads the index, truncating it at the first row not completely written (i.e., without the final newline or
+        pointing beyond the end of its segment) by a crash, so the next rows are appended after a complete one
+        """
+        segment_sizes = dict()
+        valid_size = 0
+        with open(index_filename, 'rb') as fp:
+            for line in fp:
+                row = line.decode('utf-8', errors='replace').rstrip('\n').split('\t')
+                if not line.endswith(b'\n') or len(row) != 4 or not row[2].isdigit() or not row[3].isdigit():
+                    break
+                segment, offset, length = row[1], int(row[2]), int(row[3])
+                if segment not in segment_sizes:
+                    filename = os.path.join(self.folder, segment)
+                    segment_sizes[segment] = os.path.getsize(filename) if os.path.exists(filename) else -1
+                if offset + length > segment_sizes[segment]:
+                    break
+                self.index.setdefault(row[0], []).append([segment, offset, length])
+                valid_size += len(line)
+        if valid_size < os.path.getsize(index_filename):
+            with open(index_filename, 'r+b') as fp:
+                fp.truncate(valid_size)
+
+    @classmethod
+    def exists(cls, folder):
+        return os.path.exists(os.path.join(folder, cls.INDEX_FILENAME))
+
+    def __segment_name(self, n):
+        return f'segment_{n:05d}.jsonl'
+
+    def __current_segment(self):
+        if self._n_segments == 0:
+            self._n_segments = 1
+        segment = self.__segment_name(self._n_segments - 1)
+        filename = os.path.join(self.folder, segment)
+        if os.path.exists(filename) and os.path.getsize(filename) >= self.segment_size:
+            self._n_segments += 1
+            segment = self.__segment_name(self._n_segments - 1)
+        return segment
+
+    def append(self, users):
+        """
+        Appends a dict {user: {'posts': {date: [...]}, 'comments': {date: [...]}}} to the store
+        """
+        if not users:
+            return
+        segment = self.__current_segment()
+        entries = list()
+        with open(os.path.join(self.folder, segment), 'ab') as fp:
+            offset = fp.tell()
+            for user in users:
+                line = json.dumps(users[user], separators=(',', ':')).encode('utf-8') + b'\n'
+                fp.write(line)
+                entries.append((user, offset, len(line)))
+                offset += len(line)
+        # index entries are written only once their data is on disk
+        with open(os.path.join(self.folder, self.INDEX_FILENAME), 'a') as fp:
+            for user, offset, length in entries:
+                fp.write(f'{user}\t{segment}\t{offset}\t{length}\n')
+                self.index.setdefault(user, []).append([segment, offset, length])
+
+    def users(self):
+        return list(self.index.keys())
+
+    def user_size(self, user):
+        return sum(length for _, _, length in self.index[user])
+
+    def load_user(self, user):
+        """
+        returns the data of user in the same format of the per-user JSON files
+        (i.e., {'posts': {date: [...]}, 'comments': {date: [...]}})
+        """
+        data = {'posts': {}, 'comments': {}}
+        handles = dict()
+        try:
+            for segment, offset, length in self.index[user]:
+                if segment not in handles:
+                    handles[segment] = open(os.path.join(self.folder, segment), 'rb')
+                handles[segment].seek(offset)
+                chunk = json.loads(handles[segment].read(length))
+                for kind in ('posts', 'comments'):
+                    for dt, records in chunk.get(kind, {}).items():
+                        if dt in data[kind]:
+                            data[kind][dt].extend(records)
+                        else:
+                            data[kind][dt] = records
+        finally:
+            for fp in handles.values():
+                fp.close()
+        return data
+
+    def compact(self):
+        """
+        Rewrites the store in a new segment with one line for each user and removes the old segments
+        """
+        old_segments = sorted(glob.glob(os.path.join(self.folder, 'segment_*.jsonl')))
+        self._n_segments += 1
+        segment = self.__segment_name(self._n_segments - 1)
+        index = dict()
+        with open(os.path.join(self.folder, segment), 'wb') as fp:
+            offset = 0
+            for user in self.index:
+                line = json.dumps(self.load_user(user), separators=(',', ':')).encode('utf-8') + b'\n'
+                fp.write(line)
+                index[user] = [[segment, offset, len(line)]]
+                offset += len(line)
+        tmp_filename = os.path.join(self.folder, self.INDEX_FILENAME + '.tmp')
+        with open(tmp_filename, 'w') as fp:
+            for user, [[_, offset, length]] in index.items():
+                fp.write(f'{user}\t{segment}\t{offset}\t{length}\n')
+        os.replace(tmp_filename, os.path.join(self.folder, self.INDEX_FILENAME))
+        self.index = index
+        for filename in old_segments:
+            os.remove(filename)
+
+    def export(self, path):
+        """
+        Writes the store as one JSON file for each user in path (i.e., the default output layout)
+        """
+        for user in self.index:
+            with open(os.path.join(path, f'{user}.json'), 'w') as fp:
+                json.dump(self.load_user(user), fp, sort_keys=True, indent=4)
+
+
+def list_category(path_category):
+    """
+    returns the users of a category, in the same order of load_category
+    """
+    if SegmentStore.exists(path_category):
+        return SegmentStore(path_category).users()
+    return [os.path.basename(user_file)[:-len('.json')]
+            for user_file in sorted(glob.glob(os.path.join(path_category, '*.json')))]
+
+
+def category_sizes(path_category):
+    """
+    returns a dict {user: size in bytes of its stored data}, which grows each time new data of the user are saved
+    """
+    if SegmentStore.exists(path_category):
+        store = SegmentStore(path_category)
+        return {user: store.user_size(user) for user in store.users()}
+    return {user: os.path.getsize(os.path.join(path_category, f'{user}.json'))
+            for user in list_category(path_category)}
+
+
+def load_category(path_category, users=None):
+    """
+    Generator over (user, data) of a category, read from the SegmentStore or from the user JSON files
+    (only the users in the list users, in its order, when it is not None)
+    """
+    if SegmentStore.exists(path_category):
+        store = SegmentStore(path_category)
+        for user in (store.users() if users is None else users):
+            yield user, store.load_user(user)
+    else:
+        if users is None:
+            users = list_category(path_category)
+        for user in users:
+            with open(os.path.join(path_category, f'{user}.json')) as fp:
+                yield user, json.loads(fp.read())
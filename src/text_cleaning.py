@@ -0,0 +1,108 @@
+import re
+import string
+from multiprocessing import Pool
+
+# precompiled steps of the cleaning pipeline
+_XSLT_TAGS = re.compile(r'&lt;/?[a-z]+&gt;')
+_URLS = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+_DIGIT_RUN = re.compile(r'\d\w*')
+_WORD_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+_SPACES = re.compile(r'\s{2,}')
+# one byte translation removing the not printable ASCII characters and replacing newlines and tabs with spaces
+# (the following steps never match newlines, tabs or spaces, so the replacement can be done first)
+_NEWLINES_TABLE = bytes.maketrans(b'\n\t', b'  ')
+_NOT_PRINTABLE = bytes(i for i in range(128) if chr(i) not in string.printable)
+_PUNCTUATION = string.punctuation.encode('ascii')
+
+
+def _reference_clean_raw_text(text):
+    """
+    Original implementation of clean_raw_text, kept to check and benchmark the fused one
+    """
+    # Lowercasing text
+    text = text.lower()
+    # Removing not printable characters
+    text = ''.join(filter(lambda x: x in string.printable, text))
+    # Removing XSLT tags
+    text = re.sub(r'&lt;/?[a-z]+&gt;', '', text)
+    text = text.replace(r'&amp;', 'and')
+    text = text.replace(r'&gt;', '')
+    # Removing newline, tabs and special reddit words
+    text = text.replace('\n', ' ')
+    text = text.replace('\t', ' ')
+    text = text.replace('[deleted]', '').replace('[removed]', '')
+    # Removing URLs
+    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+    # Removing numbers
+    text = re.sub(r'\w*\d+\w*', '', text)
+    # Removing Punctuation
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    # Removing extra spaces
+    text = re.sub(r'\s{2,}', " ", text)
+    return text
+
+
+def _remove_numbers(text):
+    """
+    Same as re.sub(r'\w*\d+\w*', '', text) on ASCII text (i.e., removes the words containing a digit), but
+    scanning only for digits and then moving back to the beginning of their word
+    """
+    pieces = list()
+    last = 0
+    for match in _DIGIT_RUN.finditer(text):
+        start = match.start()
+        while start > last and text[start - 1] in _WORD_CHARS:
+            start -= 1
+        pieces.append(text[last:start])
+        last = match.end()
+    if last == 0:
+        return text
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+
+def clean_raw_text(text):
+    """
+    Clean raw post/comment text with standard preprocessing pipeline
+    """
+    # Lowercasing text
+    text = text.lower()
+    # Removing not printable characters (all the printable ones are ASCII), newlines and tabs
+    text = text.encode('ascii', 'ignore').translate(_NEWLINES_TABLE, _NOT_PRINTABLE).decode('ascii')
+    # Removing XSLT tags
+    if '&' in text:
+        text = _XSLT_TAGS.sub('', text)
+        text = text.replace('&amp;', 'and')
+        text = text.replace('&gt;', '')
+    # Removing special reddit words
+    if '[' in text:
+        text = text.replace('[deleted]', '').replace('[removed]', '')
+    # Removing URLs
+    if 'http' in text:
+        text = _URLS.sub('', text)
+    # Removing numbers
+    text = _remove_numbers(text)
+    # Removing Punctuation
+    text = text.encode('ascii').translate(None, _PUNCTUATION).decode('ascii')
+    # Removing extra spaces
+    text = _SPACES.sub(' ', text)
+    return text
+
+
+def clean_many(texts, n_jobs=1, chunksize=1000):
+    """
+    Cleans a list of raw post/comment texts, returning the list of clean texts in the same order
+
+    Parameters
+    ----------
+    texts : list
+        raw texts
+    n_jobs : int, optional
+        number of processes used to clean the texts, 1 to clean them in the current process. The default is 1
+    chunksize : int, optional
+        number of texts sent to a process at a time. The default is 1000
+    """
+    if n_jobs <= 1 or len(texts) <= chunksize:
+        return [clean_raw_text(text) for text in texts]
+    with Pool(n_jobs) as pool:
+        return pool.map(clean_raw_text, texts, chunksize=chunksize)
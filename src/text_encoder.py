@@ -0,0 +1,83 @@
+from stop_words import get_stop_words
+from src.lstm_inference import pad_post
+
+
+class TextEncoder:
+    """
+    Fused stop words removal and tokenization of the texts to predict: the stop words are a frozenset and each
+    distinct word is mapped to its token IDs once (lowercasing, filters, vocabulary, num_words and out-of-vocabulary
+    token of the tokenizer), giving the same sequences of
+    tokenizer.texts_to_sequences([remove_stopWords(text) for text in texts])
+    """
+
+    def __init__(self, tokenizer, language='en', max_words=1000000):
+        """
+        Parameters
+        ----------
+        tokenizer : keras.preprocessing.text.Tokenizer or lstm_inference.VocabTokenizer
+            fitted tokenizer of the model
+        language : str, optional
+            language of the stop words. The default is 'en'
+        max_words : int, optional
+            maximum number of distinct words remembered, the memo is emptied when it grows beyond. The default is
+            1000000
+        """
+        self.tokenizer = tokenizer
+        self.stop_words = frozenset(get_stop_words(language))
+        self.max_words = max_words
+        self._filters_table = str.maketrans({char: tokenizer.split for char in tokenizer.filters})
+        num_words = tokenizer.num_words
+        self._oov = tokenizer.word_index.get(tokenizer.oov_token) if tokenizer.oov_token is not None else None
+        # token IDs of each vocabulary word (i.e., out-of-vocabulary token beyond num_words)
+        self._vocabulary = {word: (index,) if not num_words or index < num_words else
+                            ((self._oov,) if self._oov is not None else ())
+                            for word, index in tokenizer.word_index.items()}
+        # the words of a text without stop words are joined by spaces before the tokenization, so they can be
+        # tokenized one by one only if the tokenizer splits on spaces
+        self.fused = tokenizer.split == ' ' and not getattr(tokenizer, 'char_level', False)
+        self._memo = dict()
+
+    def remove_stop_words(self, text):
+        stop_words = self.stop_words
+        return ' '.join(word for word in text.split() if word not in stop_words)
+
+    def __word_tokens(self, word):
+        if word in self.stop_words:
+            return ()
+        if self.tokenizer.lower:
+            word = word.lower()
+        tokens = list()
+        for piece in word.translate(self._filters_table).split(' '):
+            if piece:
+                found = self._vocabulary.get(piece)
+                if found is not None:
+                    tokens.extend(found)
+                elif self._oov is not None:
+                    tokens.append(self._oov)
+        return tuple(tokens)
+
+    def texts_to_sequences(self, texts):
+        """
+        returns the list of token IDs of each text, stop words removed
+        """
+        if not self.fused:
+            return self.tokenizer.texts_to_sequences([self.remove_stop_words(text) for text in texts])
+        memo = self._memo
+        if len(memo) > self.max_words:
+            memo.clear()
+        sequences = list()
+        for text in texts:
+            sequence = list()
+            for word in text.split():
+                tokens = memo.get(word)
+                if tokens is None:
+                    tokens = memo[word] = self.__word_tokens(word)
+                sequence.extend(tokens)
+            sequences.append(sequence)
+        return sequences
+
+    def encode(self, texts, maxlen=350):
+        """
+        returns the padded int32 matrix (see pad_post) of the token IDs of the texts
+        """
+        return pad_post(self.texts_to_sequences(texts), maxlen=maxlen)
@@ -16,6 +16,8 @@ from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from textblob import TextBlob
 from nrclex import NRCLex
 from nltk.corpus import stopwords
+from src.prediction_cache import file_fingerprint
+from src.run_manifest import RunManifest
 
 
 class TextStatisticGenerator(object):
@@ -130,10 +132,18 @@ class TextStatisticGenerator(object):
         else:
             return None
 
-    def extract_statistics(self):
+    def extract_statistics(self, incremental=False):
         """
         for each category, for each time period, for each user collcting their texts (posts/comments)
         (i.e., 'clean_text' field) and then computing a features vector containing text's statistics
+
+        Parameters
+        ----------
+        incremental : bool, optional
+            True to compute the statistics only of the users whose file is new or changed since the previous
+            incremental run (see RunManifest, stored in Text_Statistics/{category}/.{period}.manifest.json) and merge
+            them with the statistics of the other users, False to compute all of them. All the users are computed
+            again if the lexicons or extract_post/extract_comment changed. The default is False
         """
         # open VAD affect Lexicon
         with open('psycholing_features_rates/VAD_Lexicon_Arousal.json') as fp:
@@ -174,6 +184,10 @@ class TextStatisticGenerator(object):
                     shutil.unpack_archive(file_name, extract_dir, 'zip')
                     unzipped_categories.append(unzipped_filename)
         print('unzipped:', unzipped_categories)
+        if incremental:
+            settings = {'extract_post': self.extract_post, 'extract_comment': self.extract_comment,
+                        'lexicons': file_fingerprint(*sorted(os.path.join('psycholing_features_rates', name)
+                                                             for name in os.listdir('psycholing_features_rates')))}
 
         # collecting texts for each category,period,user
         for category in unzipped_categories:
@@ -188,6 +202,11 @@ class TextStatisticGenerator(object):
                 path_period = os.path.join(path_category, period)
                 users_list = os.listdir(path_period)
                 users_stats = dict()
+                all_users = users_list
+                if incremental:
+                    manifest = RunManifest(os.path.join(textstats_category, f'.{period}.manifest.json'), settings)
+                    previous, users_list = manifest.split(path_period, all_users)
+                    print('unchanged users:', len(previous), 'users to compute:', len(users_list))
                 # collecting user texts 
                 for user in users_list:
                     user_filename = os.path.join(path_period, user)
@@ -312,6 +331,16 @@ class TextStatisticGenerator(object):
                                                     'cnt_LNP_Interoceptive': LNP['Interoceptive'],
                                                     'cnt_LNP_Gustatory': LNP['Gustatory']}
 
+                if incremental:
+                    for user in users_list:
+                        manifest.record(user, users_stats[user.replace('.json', '')])
+                    # merging the statistics of the unchanged users, in users_list order as in a complete run
+                    computed = users_stats
+                    users_stats = dict()
+                    for user in all_users:
+                        username = user.replace('.json', '')
+                        users_stats[username] = computed[username] if username in computed else previous[user]
+
                 nodes, word_count, unique_words_cnt, lexical_diversity, vader_positive, vader_negative, vader_neutral, \
                 vader_compound, textblob_polarity, textblob_subjectivity, NRCL_positive, NRCL_negative, \
                 NRCL_anticipation, NRCL_surprise, NRCL_trust, NRCL_joy, NRCL_fear, NRCL_anger, NRCL_sadness, \
@@ -381,6 +410,8 @@ class TextStatisticGenerator(object):
                 period_filename = os.path.join(textstats_category, f'{period}.json')
                 with open(period_filename, 'w') as fp:
                     json.dump(users_stats, fp, sort_keys=True, indent=4)
+                if incremental:
+                    manifest.commit()
                 print("--- %s seconds ---" % (time.time() - start_time))
 
 
@@ -0,0 +1,56 @@
+import sqlite3
+
+
+class ThingIndex:
+    """
+    persistent index (SQLite) mapping the ID of each extracted post/comment (i.e., thing) to its author and
+    created_utc, updated at each flush of the extraction and queried in bulk to resolve the parents of comments
+    extracted in other time windows or categories
+    """
+
+    # maximum number of IDs in a single lookup query (i.e., SQLite limit on the query parameters)
+    CHUNK_SIZE = 900
+
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            path of the SQLite database, created if it does not exist
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS things '
+                                '(thing_id TEXT PRIMARY KEY, author TEXT, created_utc INTEGER) WITHOUT ROWID')
+
+    def add_users(self, users):
+        """
+        Adds the posts and comments of a dict {user: {'posts': {date: [...]}, 'comments': {date: [...]}}}
+        """
+        self.add((record['id'], record['author'], record.get('created_utc')) for data in users.values()
+                 for kind in ('posts', 'comments') for records in data.get(kind, {}).values() for record in records)
+
+    def add(self, rows):
+        """
+        Adds an iterable of (thing_id, author, created_utc), created_utc can be None
+        """
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO things VALUES (?, ?, ?)', rows)
+
+    def lookup(self, thing_ids):
+        """
+        returns a dict {thing_id: (author, created_utc)} of the thing_ids found in the index
+        """
+        thing_ids = list(thing_ids)
+        found = dict()
+        for i in range(0, len(thing_ids), self.CHUNK_SIZE):
+            chunk = thing_ids[i:i + self.CHUNK_SIZE]
+            query = f"SELECT thing_id, author, created_utc FROM things WHERE thing_id IN ({','.join('?' * len(chunk))})"
+            for thing_id, author, created_utc in self.connection.execute(query, chunk):
+                found[thing_id] = (author, created_utc)
+        return found
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,154 @@
+import numpy as np
+from src.segment_store import load_category
+
+
+class ThreadIndex:
+    """
+    index of the discussion trees of a category, rebuilt from link_id/parent_id of the comments: the nodes (the
+    submission of each thread followed by its comments, parents before children) are stored in compact arrays
+    with a parent pointer, child offsets (CSR), depth and subtree size of each node. The comments whose parent
+    was not extracted are attached to the submission of their thread (i.e., their depth is a lower bound).
+    """
+
+    ARRAYS = ('ids', 'authors', 'usernames', 'thread_ptr', 'parent', 'child_ptr', 'children', 'depth',
+              'subtree_size', 'created_utc')
+
+    def __init__(self, **arrays):
+        """
+        Parameters
+        ----------
+        arrays : numpy.ndarray
+            arrays of the index (see build and load)
+        """
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        # node indexes sorted by ID, to find the nodes with a binary search
+        self._id_order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._id_order]
+
+    @classmethod
+    def build(cls, path_category):
+        """
+        returns the ThreadIndex of the posts and comments of a category (user JSON files or SegmentStore)
+        """
+        nodes = dict()  # thing ID -> [thread ID, parent ID, author, created_utc]
+        for _, data in load_category(path_category):
+            for posts in data['posts'].values():
+                for post in posts:
+                    nodes[post['id']] = [post['id'], None, post['author'], post.get('created_utc')]
+            for comments in data['comments'].values():
+                for comment in comments:
+                    nodes[comment['id']] = [comment['link_id'].split('_')[1], comment['parent_id'].split('_')[1],
+                                            comment['author'], comment.get('created_utc')]
+        # submissions not extracted (i.e., threads known only from their comments)
+        for thread in {node[0] for node in list(nodes.values())}:
+            if thread not in nodes:
+                nodes[thread] = [thread, None, None, None]
+        for node in nodes.values():
+            # orphan comments (i.e., parent not extracted or in another thread)
+            if node[1] is not None and (node[1] not in nodes or nodes[node[1]][0] != node[0]):
+                node[1] = node[0]
+        depths = dict()
+        for thing_id, node in nodes.items():
+            # depth of the ancestors not computed yet
+            path = list()
+            current = thing_id
+            while current not in depths and nodes[current][1] is not None:
+                path.append(current)
+                current = nodes[current][1]
+                if len(path) > len(nodes):
+                    raise ValueError(f'Cycle in the replies of thread {node[0]}')
+            depth = depths.setdefault(current, 0)
+            for ancestor in reversed(path):
+                depth += 1
+                depths[ancestor] = depth
+        # nodes grouped by thread, parents before children
+        order = sorted(nodes, key=lambda thing_id: (nodes[thing_id][0], depths[thing_id], thing_id))
+        position = {thing_id: i for i, thing_id in enumerate(order)}
+        usernames = sorted({node[2] for node in nodes.values() if node[2] is not None})
+        user_ids = {username: i for i, username in enumerate(usernames)}
+        parent = np.array([position[nodes[thing_id][1]] if nodes[thing_id][1] is not None else -1
+                           for thing_id in order], dtype=np.int64)
+        threads = np.array([nodes[thing_id][0] for thing_id in order])
+        thread_starts = np.flatnonzero(np.r_[True, threads[1:] != threads[:-1]]) if len(order) else \
+            np.zeros(0, dtype=np.int64)
+        depth = np.array([depths[thing_id] for thing_id in order], dtype=np.int32)
+        children = np.argsort(parent, kind='stable')
+        children = children[parent[children] >= 0]
+        child_ptr = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parent[parent >= 0], minlength=len(order)), out=child_ptr[1:])
+        # subtree sizes accumulated from the deepest level to the roots
+        subtree_size = np.ones(len(order), dtype=np.int64)
+        for level in range(int(depth.max()) if len(order) else 0, 0, -1):
+            level_nodes = np.flatnonzero(depth == level)
+            np.add.at(subtree_size, parent[level_nodes], subtree_size[level_nodes])
+        return cls(ids=np.array(order, dtype=str),
+                   authors=np.array([user_ids.get(nodes[thing_id][2], -1) for thing_id in order], dtype=np.int32),
+                   usernames=np.array(usernames, dtype=str),
+                   thread_ptr=np.r_[thread_starts, len(order)].astype(np.int64),
+                   parent=parent, child_ptr=child_ptr, children=children.astype(np.int64), depth=depth,
+                   subtree_size=subtree_size,
+                   created_utc=np.array([nodes[thing_id][3] or 0 for thing_id in order], dtype=np.int64))
+
+    def save(self, filename):
+        np.savez(filename, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as arrays:
+            return cls(**{name: arrays[name] for name in cls.ARRAYS})
+
+    def node(self, thing_id):
+        """
+        returns the node index of a post/comment ID (without the t1_/t3_ prefix)
+        """
+        i = np.searchsorted(self._sorted_ids, thing_id)
+        if i == len(self._sorted_ids) or self._sorted_ids[i] != thing_id:
+            raise KeyError(thing_id)
+        return int(self._id_order[i])
+
+    def thread(self, thing_id):
+        """
+        returns the index of the thread of a post/comment
+        """
+        return int(np.searchsorted(self.thread_ptr, self.node(thing_id), side='right')) - 1
+
+    def children_of(self, thing_id):
+        node = self.node(thing_id)
+        return self.ids[self.children[self.child_ptr[node]:self.child_ptr[node + 1]]].tolist()
+
+    def depth_of(self, thing_id):
+        """
+        returns the depth of a post (0) or comment (1 for the replies to the post)
+        """
+        return int(self.depth[self.node(thing_id)])
+
+    def subtree_size_of(self, thing_id):
+        """
+        returns the number of nodes of the subtree of a post/comment (itself included)
+        """
+        return int(self.subtree_size[self.node(thing_id)])
+
+    def participants(self, link_id):
+        """
+        returns the set of the users who wrote the post or a comment of a thread
+        """
+        thread = self.thread(link_id)
+        authors = self.authors[self.thread_ptr[thread]:self.thread_ptr[thread + 1]]
+        return set(self.usernames[np.unique(authors[authors >= 0])].tolist())
+
+    def thread_stats(self):
+        """
+        returns a dict of arrays with ID, number of comments, maximum depth and number of participants of each
+        thread
+        """
+        starts = self.thread_ptr[:-1]
+        thread_of_node = np.repeat(np.arange(len(starts)), np.diff(self.thread_ptr))
+        max_depth = np.zeros(len(starts), dtype=np.int32)
+        np.maximum.at(max_depth, thread_of_node, self.depth)
+        # distinct (thread, author) pairs
+        known = self.authors >= 0
+        pairs = np.unique(thread_of_node[known].astype(np.int64) * (len(self.usernames) + 1) + self.authors[known])
+        n_participants = np.bincount(pairs // (len(self.usernames) + 1), minlength=len(starts))
+        return {'thread': self.ids[starts], 'n_comments': self.subtree_size[starts] - 1, 'max_depth': max_depth,
+                'n_participants': n_participants}
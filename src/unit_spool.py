@@ -0,0 +1,86 @@
+import os
+import pickle
+import queue
+import threading
+
+
+class UnitSpool:
+    """
+    ordered flushes (users, cursor) of the work units of a concurrent extraction, written by the workers and read
+    unit by unit in units order: the flushes are kept in memory up to a budget of records shared by all the units,
+    the next ones are appended to a spool file of their unit, so a worker never waits for the previous units to be
+    saved
+    """
+
+    def __init__(self, folder, n_units, memory_records):
+        """
+        Parameters
+        ----------
+        folder : str
+            path of the folder of the spool files (e.g., a temporary folder removed after the extraction)
+        n_units : int
+            number of work units
+        memory_records : int
+            maximum number of records of the flushes kept in memory
+        """
+        self.folder = folder
+        self.memory_records = memory_records
+        self.n_records = 0
+        self._lock = threading.Lock()
+        # unit -> (users, cursor, n_records) of each flush, users is None if the flush is in the spool file,
+        # None at the end of the unit
+        self._queues = [queue.Queue() for _ in range(n_units)]
+        self._writers = dict()  # unit -> spool file, written only by the worker of the unit
+
+    def spool_filename(self, unit):
+        return os.path.join(self.folder, f'{unit}.spool')
+
+    @staticmethod
+    def __count(users):
+        return sum(len(records) for user in users.values() for dates in user.values() for records in dates.values())
+
+    def put(self, unit, users, cursor):
+        """
+        Adds a flush of unit, in memory if the budget allows it, to its spool file otherwise
+        """
+        n_records = self.__count(users)
+        with self._lock:
+            in_memory = self.n_records + n_records <= self.memory_records
+            if in_memory:
+                self.n_records += n_records
+        if in_memory:
+            self._queues[unit].put((users, cursor, n_records))
+            return
+        if unit not in self._writers:
+            self._writers[unit] = open(self.spool_filename(unit), 'wb')
+        pickle.dump((users, cursor), self._writers[unit], protocol=pickle.HIGHEST_PROTOCOL)
+        # readable before being announced
+        self._writers[unit].flush()
+        self._queues[unit].put((None, cursor, 0))
+
+    def finish(self, unit):
+        """
+        Marks the end of the flushes of unit (also after an error)
+        """
+        if unit in self._writers:
+            self._writers.pop(unit).close()
+        self._queues[unit].put(None)
+
+    def flushes(self, unit):
+        """
+        Generator over the (users, cursor) flushes of unit, in the order they were added, until its end
+        """
+        reader = None
+        try:
+            for users, cursor, n_records in iter(self._queues[unit].get, None):
+                if users is None:
+                    if reader is None:
+                        reader = open(self.spool_filename(unit), 'rb')
+                    users, cursor = pickle.load(reader)
+                else:
+                    with self._lock:
+                        self.n_records -= n_records
+                yield users, cursor
+        finally:
+            if reader is not None:
+                reader.close()
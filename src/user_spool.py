@@ -0,0 +1,125 @@
+import json
+import os
+
+
+class UserSpool:
+    """
+    streams the records of the users extracted by a worker to disk: records are buffered in memory and appended
+    to a spool file for each user (one JSON line per record) when the buffered size exceeds the memory budget;
+    finish() writes the user JSON file reading the spool as a stream, so the JSON file is always rebuilt from
+    the spool
+    """
+
+    def __init__(self, folder, memory_budget, kinds=('posts', 'comments')):
+        """
+        Parameters
+        ----------
+        folder : str
+            path of the User_data folder
+        memory_budget : int
+            maximum size in bytes of the buffered records
+        kinds : tuple, optional
+            keys of the user JSON files (i.e., 'posts' and/or 'comments'). The default is ('posts', 'comments')
+        """
+        self.folder = folder
+        self.memory_budget = memory_budget
+        self.kinds = sorted(kinds)
+        self.buffers = dict()  # username -> list of JSON lines
+        self.size = 0
+
+    def spool_filename(self, username):
+        return os.path.join(self.folder, f'.{username}.spool')
+
+    def add(self, username, kind, record):
+        line = json.dumps([kind, record]) + '\n'
+        self.buffers.setdefault(username, []).append(line)
+        self.size += len(line)
+
+    def is_full(self):
+        return self.size >= self.memory_budget
+
+    def flush(self):
+        """
+        Appends the buffered records to the spool files
+        returns a dict with the spool size (in bytes) of each user
+        """
+        sizes = dict()
+        for username, lines in self.buffers.items():
+            with open(self.spool_filename(username), 'a') as fp:
+                fp.writelines(lines)
+                sizes[username] = fp.tell()
+        self.buffers = dict()
+        self.size = 0
+        return sizes
+
+    def spool_size(self, username):
+        filename = self.spool_filename(username)
+        return os.path.getsize(filename) if os.path.exists(filename) else 0
+
+    def seed(self, user_filename, username):
+        """
+        Starts the spool of username with the records of an existing user JSON file (i.e., the data extracted by
+        a previous run, extended by the current one)
+        """
+        with open(user_filename) as fp:
+            data = json.loads(fp.read())
+        with open(self.spool_filename(username), 'w') as fp:
+            for kind in self.kinds:
+                for record in data.get(kind, []):
+                    fp.write(json.dumps([kind, record]) + '\n')
+
+    def remove(self, username):
+        filename = self.spool_filename(username)
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    def truncate(self, username, size):
+        """
+        Truncates the spool of username to size bytes (i.e., the size committed with its cursor), removing the
+        records appended after the last commit
+        """
+        filename = self.spool_filename(username)
+        if os.path.exists(filename):
+            with open(filename, 'r+') as fp:
+                fp.truncate(size or 0)
+
+    def __records(self, username, kind):
+        with open(self.spool_filename(username)) as fp:
+            for line in fp:
+                line_kind, record = json.loads(line)
+                if line_kind == kind:
+                    yield record
+
+    def finish(self, username):
+        """
+        Writes the JSON file of username (i.e., the same file written by json.dump(data, fp, sort_keys=True,
+        indent=4)) from its spool, named after the author of its records
+        returns the name of the JSON file, None if no records were extracted
+        """
+        spool_filename = self.spool_filename(username)
+        if not os.path.exists(spool_filename):
+            return None
+        author = None
+        with open(spool_filename) as fp:
+            for line in fp:
+                author = json.loads(line)[1].get('author') or username
+                break
+        if author is None:  # no records extracted
+            return None
+        user_filename = os.path.join(self.folder, f'{author}.json')
+        tmp_filename = user_filename + '.tmp'
+        with open(tmp_filename, 'w') as fp:
+            fp.write('{')
+            for n_kind, kind in enumerate(self.kinds):
+                fp.write(',\n' if n_kind else '\n')
+                fp.write(f'    {json.dumps(kind)}: [')
+                n_records = 0
+                for record in self.__records(username, kind):
+                    fp.write(',\n' if n_records else '\n')
+                    fp.write('\n'.join('        ' + row for row in
+                                       json.dumps(record, sort_keys=True, indent=4).split('\n')))
+                    n_records += 1
+                fp.write('\n    ]' if n_records else ']')
+            fp.write('\n}' if self.kinds else '}')
+        os.replace(tmp_filename, user_filename)
+        return f'{author}.json'
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from src.columnar_store import ColumnarWriter, read_records
+
+
+def test_read_records_projects_columns_of_kind(tmp_path):
+    writer = ColumnarWriter(str(tmp_path), ['id', 'author', 'num_comments', 'title'], ['id', 'author', 'body'])
+    users = {'alice': {'posts': {'02/01/2021': [{'id': 'p1', 'author': 'alice', 'num_comments': 3,
+                                                  'clean_text': 'a post', 'date': '02/01/2021'}]},
+                       'comments': {'01/01/2021': [{'id': 'c1', 'author': 'alice', 'link_id': 't3_p1',
+                                                     'parent_id': 't3_p1', 'clean_text': 'a comment',
+                                                     'date': '01/01/2021'}]}}}
+    writer.write('finance', users)
+    posts = read_records(str(tmp_path), 'posts', ['id', 'num_comments'])
+    assert posts.to_pydict() == {'id': ['p1'], 'num_comments': [3]}
+    comments = read_records(str(tmp_path), 'comments', ['id', 'parent_id'], [('category', '=', 'finance')])
+    assert comments.to_pydict() == {'id': ['c1'], 'parent_id': ['t3_p1']}
+    assert read_records(str(tmp_path), 'comments', ['id'], [('day', '>', '2021-01-01')]).num_rows == 0
@@ -0,0 +1,87 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+keras = pytest.importorskip('keras')
+pytest.importorskip('h5py')
+
+from src.lstm_inference import NumpyLSTMModel, VocabTokenizer, export_keras_model, pad_post
+
+VOCABULARY_SIZE = 301
+# maximum absolute difference from the keras predictions for each quantization
+TOLERANCES = {None: 1e-5, 'float16': 5e-3, 'int8': 3e-2}
+
+
+def build_model(variant):
+    layers = keras.layers
+    if variant == 'masked':
+        stack = [layers.Embedding(VOCABULARY_SIZE, 16, mask_zero=True), layers.LSTM(12),
+                 layers.Dense(1, activation='sigmoid')]
+    elif variant == 'unmasked':
+        stack = [layers.Embedding(VOCABULARY_SIZE, 16), layers.SpatialDropout1D(0.2), layers.LSTM(12, dropout=0.2),
+                 layers.Dropout(0.3), layers.Dense(1, activation='sigmoid')]
+    else:
+        stack = [layers.Embedding(VOCABULARY_SIZE, 16, mask_zero=True), layers.LSTM(10, return_sequences=True),
+                 layers.Bidirectional(layers.LSTM(8)), layers.Dense(5, activation='relu'),
+                 layers.Dense(1, activation='sigmoid')]
+    model = keras.Sequential([keras.Input((None,))] + stack)
+    rng = np.random.RandomState(1)
+    for weight in model.weights:
+        # larger weights than the default initialization, so that the states saturate
+        weight.assign(rng.randn(*weight.shape).astype('float32') * 0.4)
+    return model
+
+
+@pytest.fixture(scope='module')
+def sequences():
+    rng = np.random.RandomState(0)
+    # empty, short and truncated sequences
+    return pad_post([list(rng.randint(1, VOCABULARY_SIZE, size=rng.choice([0, 1, 5, 30, 80]))) for _ in range(100)],
+                    maxlen=60)
+
+
+@pytest.fixture(scope='module')
+def tokenizer_file(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('tokenizer') / 'tokenizer.pickle')
+    tokenizer = VocabTokenizer({f'w{i}': i for i in range(1, VOCABULARY_SIZE)}, num_words=250, oov_token='w1',
+                               filters='!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n')
+    with open(filename, 'wb') as fp:
+        pickle.dump(tokenizer, fp)
+    return filename
+
+
+@pytest.fixture(scope='module', params=['masked', 'unmasked', 'bidirectional'])
+def keras_model(request, tmp_path_factory, sequences):
+    folder = tmp_path_factory.mktemp(request.param)
+    model = build_model(request.param)
+    with open(folder / 'model.json', 'w') as fp:
+        fp.write(model.to_json())
+    model.save(str(folder / 'model.h5'))
+    model.save_weights(str(folder / 'model.weights.h5'))
+    return folder, model.predict(sequences, verbose=0)
+
+
+@pytest.mark.parametrize('weights_file', ['model.h5', 'model.weights.h5'])
+@pytest.mark.parametrize('quantization', [None, 'float16', 'int8'])
+def test_numpy_model_matches_keras(keras_model, tokenizer_file, sequences, weights_file, quantization):
+    folder, expected = keras_model
+    out_file = str(folder / f'model_{quantization}.npz')
+    export_keras_model(str(folder / 'model.json'), str(folder / weights_file), tokenizer_file, out_file,
+                       quantization=quantization)
+    model = NumpyLSTMModel(out_file)
+    predictions = model.predict_proba(sequences)
+    assert predictions.shape == expected.shape and predictions.dtype == np.float32
+    assert np.abs(predictions - expected).max() < TOLERANCES[quantization]
+
+
+def test_pad_post_matches_keras():
+    try:
+        pad_sequences = keras.utils.pad_sequences
+    except AttributeError:  # keras < 2.9
+        pad_sequences = keras.preprocessing.sequence.pad_sequences
+    sequences = [[], [1], list(range(1, 20)), list(range(1, 400))]
+    assert (pad_post(sequences, maxlen=350) ==
+            pad_sequences(sequences, maxlen=350, padding='post', truncating='pre')).all()
@@ -0,0 +1,78 @@
+import json
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip('stop_words')
+pytest.importorskip('pandas')
+
+from src.polarization_classifier import PolarizationClassifier
+
+
+def write_model(filename, mask_zero):
+    """
+    writes a small exported model (see lstm_inference.export_keras_model): Embedding, LSTM and Dense layers
+    """
+    rng = np.random.RandomState(0)
+    layers = [{'class_name': 'Embedding', 'mask_zero': mask_zero},
+              {'class_name': 'LSTM', 'activation': 'tanh', 'recurrent_activation': 'sigmoid',
+               'return_sequences': False, 'go_backwards': False, 'use_bias': True},
+              {'class_name': 'Dense', 'activation': 'sigmoid', 'use_bias': True}]
+    arrays = {'0_embeddings': rng.randn(20, 4), '1_kernel': rng.randn(4, 12), '1_recurrent_kernel': rng.randn(3, 12),
+              '1_bias': rng.randn(12), '2_kernel': rng.randn(3, 1), '2_bias': rng.randn(1)}
+    tokenizer = {'word_index': {f'w{i}': i for i in range(1, 20)}, 'num_words': None, 'oov_token': None,
+                 'filters': '', 'lower': True, 'split': ' ', 'char_level': False}
+    config = {'layers': layers, 'tokenizer': tokenizer, 'quantization': None}
+    np.savez(filename, __config__=np.array(json.dumps(config)),
+             **{name: array.astype(np.float32) for name, array in arrays.items()})
+
+
+def make_classifier(tmp_path, mask_zero, **kwargs):
+    write_model(str(tmp_path / 'model.npz'), mask_zero)
+    return PolarizationClassifier(str(tmp_path / 'out'), True, True, {}, '01/01/2021', '02/01/2021',
+                                  str(tmp_path / 'model.npz'), **kwargs)
+
+
+def test_dynamic_padding_only_with_masked_padding(tmp_path, capsys):
+    assert make_classifier(tmp_path, mask_zero=True).dynamic_padding
+    assert 'Dynamic padding disabled' not in capsys.readouterr().out
+    assert not make_classifier(tmp_path, mask_zero=False).dynamic_padding
+    assert 'Dynamic padding disabled' in capsys.readouterr().out
+
+
+def test_dynamic_padding_same_predictions(tmp_path):
+    classifier = make_classifier(tmp_path, mask_zero=True)
+    sequences = [[1, 2, 3], [], [4] * 40, [5, 6], list(range(1, 20)) * 30]
+    dynamic = classifier._predict_sequences(sequences, batch_size=2)
+    classifier.dynamic_padding = False
+    assert np.abs(dynamic - classifier._predict_sequences(sequences, batch_size=2)).max() < 1e-6
+
+
+def test_model_errors_are_raised(tmp_path):
+    classifier = make_classifier(tmp_path, mask_zero=True)
+
+    def failing_predict(x):
+        raise ValueError('bad input')
+
+    classifier.model.predict_proba = failing_predict
+    with pytest.raises(ValueError, match='bad input'):
+        classifier._predict_sequences([[1, 2], [3]], batch_size=2)
+    assert classifier.dynamic_padding
+
+
+def test_no_dynamic_padding_with_fixed_input_length(tmp_path, capsys):
+    keras = pytest.importorskip('keras')
+    from src.lstm_inference import VocabTokenizer
+    model = keras.Sequential([keras.Input((350,)), keras.layers.Embedding(20, 4, mask_zero=True),
+                              keras.layers.LSTM(3), keras.layers.Dense(1, activation='sigmoid')])
+    with open(tmp_path / 'model.json', 'w') as fp:
+        fp.write(model.to_json())
+    model.save_weights(str(tmp_path / 'model.weights.h5'))
+    with open(tmp_path / 'tokenizer.pickle', 'wb') as fp:
+        pickle.dump(VocabTokenizer({f'w{i}': i for i in range(1, 20)}), fp)
+    classifier = PolarizationClassifier(str(tmp_path / 'out'), True, True, {}, '01/01/2021', '02/01/2021',
+                                        str(tmp_path / 'model.json'), str(tmp_path / 'model.weights.h5'),
+                                        str(tmp_path / 'tokenizer.pickle'))
+    assert not classifier.dynamic_padding
+    assert 'only sequences of 350 tokens' in capsys.readouterr().out
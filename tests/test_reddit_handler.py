@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import random
+import time
+
+import pytest
+
+from src.reddit_handler import RedditHandler
+from src.segment_store import load_category
+
+START = 1609459200  # 01/01/2021
+
+
+class FakeClient:
+    """
+    in-memory pushshift.io API answering each request after latency seconds, with at most page_size records,
+    counting count_ratio times the records of a window
+    """
+
+    def __init__(self, subreddits, n_days=10, per_day=10, latency=0.0, page_size=25, count_ratio=1.0):
+        self.n_days = n_days
+        self.count_ratio = count_ratio
+        self.latency = latency
+        self.page_size = page_size
+        rng = random.Random(0)
+        self.records = {'submission': list(), 'comment': list()}
+        authors = [f'user{i}' for i in range(12)]
+        for subreddit in subreddits:
+            for i in range(n_days * per_day):
+                created_utc = START + rng.randrange(n_days * 24 * 60 * 60)
+                self.records['submission'].append({
+                    'id': f'{subreddit}p{i}', 'author': rng.choice(authors), 'created_utc': created_utc,
+                    'subreddit': subreddit, 'title': f'Post {i} about {subreddit}', 'selftext': 'Some text!',
+                    'score': i, 'num_comments': 2})
+            for i in range(2 * n_days * per_day):
+                post = f'{subreddit}p{rng.randrange(n_days * per_day)}'
+                parent = f't3_{post}' if i < n_days * per_day or rng.random() < 0.5 else \
+                    f't1_{subreddit}c{rng.randrange(i)}'
+                self.records['comment'].append({
+                    'id': f'{subreddit}c{i}', 'author': rng.choice(authors), 'subreddit': subreddit,
+                    'created_utc': START + rng.randrange(n_days * 24 * 60 * 60), 'body': f'Comment {i}, ok',
+                    'link_id': f't3_{post}', 'parent_id': parent, 'score': 1})
+        for records in self.records.values():
+            records.sort(key=lambda record: (record['created_utc'], record['id']))
+
+    def __select(self, endpoint, params):
+        return [record for record in self.records[endpoint]
+                if params['after'] < record['created_utc'] < params['before'] and
+                all(record[field] == params[field] for field in ('subreddit', 'author') if field in params)]
+
+    def search(self, endpoint, params):
+        time.sleep(self.latency)
+        return self.__select(endpoint, params)[:min(params['size'], self.page_size)]
+
+    def count(self, endpoint, params):
+        time.sleep(self.latency)
+        return int(len(self.__select(endpoint, params)) * self.count_ratio)
+
+
+def tree_hash(folder):
+    digest = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(folder)):
+        dirs.sort()
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            digest.update(os.path.relpath(filename, folder).encode('utf-8'))
+            with open(filename, 'rb') as fp:
+                digest.update(fp.read())
+    return digest.hexdigest()
+
+
+def extract(folder, client, extract_comment=True, adaptive_windows=False, **kwargs):
+    handler = RedditHandler(str(folder), True, extract_comment, client=client, storage='segments',
+                            adaptive_windows=adaptive_windows, window_records=40)
+    start = time.perf_counter()
+    handler.extract_periodical_data('01/01/2021', f'{client.n_days + 1:02d}/01/2021',
+                                    {'news': ['a', 'b'], 'sport': ['c', 'd']}, **kwargs)
+    return time.perf_counter() - start
+
+
+def test_concurrent_units_overlap(tmp_path):
+    client = FakeClient(['a', 'b', 'c', 'd'], n_days=20, latency=0.02)
+    sequential = extract(tmp_path / 'sequential', client, extract_comment=False)
+    concurrent = extract(tmp_path / 'concurrent', client, extract_comment=False, n_workers=4)
+    # 4 independent units of the same size, each flushing every day
+    assert concurrent < sequential / 3
+    assert tree_hash(tmp_path / 'concurrent') == tree_hash(tmp_path / 'sequential')
+
+
+def test_concurrent_units_spooled_to_disk(tmp_path, monkeypatch):
+    client = FakeClient(['a', 'b', 'c', 'd'])
+    extract(tmp_path / 'sequential', client, shard_days=2)
+    monkeypatch.setattr(RedditHandler, 'UNIT_MEMORY_RECORDS', 5)
+    extract(tmp_path / 'concurrent', client, n_workers=3, shard_days=2)
+    assert tree_hash(tmp_path / 'concurrent') == tree_hash(tmp_path / 'sequential')
+
+
+def test_adaptive_windows_underestimated_count(tmp_path):
+    client = FakeClient(['a', 'b', 'c', 'd'], count_ratio=0.5)
+    extract(tmp_path / 'daily', client)
+    extract(tmp_path / 'adaptive', client, adaptive_windows=True)
+    for category in ('news', 'sport'):
+        daily = dict(load_category(str(tmp_path / 'daily' / 'Categories_raw_data' / category)))
+        adaptive = dict(load_category(str(tmp_path / 'adaptive' / 'Categories_raw_data' / category)))
+        assert adaptive == daily
+
+
+@pytest.mark.parametrize('storage', ['json', 'segments'])
+@pytest.mark.parametrize('n_workers,shard_days', [(2, None), (5, 3)])
+def test_parallel_extraction_matches_sequential(tmp_path, storage, n_workers, shard_days):
+    client = FakeClient(['a', 'b', 'c', 'd'])
+    for folder, workers in (('sequential', 1), ('parallel', n_workers)):
+        handler = RedditHandler(str(tmp_path / folder), True, True, client=client, storage=storage)
+        handler.extract_periodical_data('01/01/2021', '11/01/2021', {'news': ['a', 'b'], 'sport': ['c', 'd']},
+                                        n_workers=workers, shard_days=shard_days)
+    assert tree_hash(tmp_path / 'parallel') == tree_hash(tmp_path / 'sequential')
+
+
+@pytest.mark.parametrize('storage', ['json', 'segments'])
+def test_parallel_network_matches_sequential(tmp_path, storage):
+    client = FakeClient(['a', 'b', 'c', 'd'])
+    categories = {'news': ['a', 'b'], 'sport': ['c', 'd']}
+    handler = RedditHandler(str(tmp_path / 'data'), True, True, client=client, storage=storage)
+    handler.extract_periodical_data('01/01/2021', '11/01/2021', categories)
+    networks = dict()
+    for n_workers in (1, 3):
+        handler.create_network(categories, n_workers=n_workers, snapshot_days=2, weighted=True)
+        networks_folder = tmp_path / 'data' / 'Categories_networks'
+        networks[n_workers] = tree_hash(networks_folder)
+        os.rename(networks_folder, tmp_path / f'networks_{n_workers}')
+    assert networks[3] == networks[1]
+
+
+def test_dump_extracts_removed_after_error(tmp_path, monkeypatch):
+    zstandard = pytest.importorskip('zstandard')
+    from src.dump_reader import PushshiftDumpReader
+    client = FakeClient(['a', 'b'])
+    os.mkdir(tmp_path / 'dumps')
+    for endpoint, prefix in (('submission', 'RS'), ('comment', 'RC')):
+        lines = ''.join(json.dumps(record) + '\n' for record in client.records[endpoint])
+        with open(tmp_path / 'dumps' / f'{prefix}_2021-01.zst', 'wb') as fp:
+            fp.write(zstandard.ZstdCompressor().compress(lines.encode('utf-8')))
+    reader = PushshiftDumpReader(str(tmp_path / 'dumps'))
+    extracts = list()
+    extract_subreddits = reader.extract_subreddits
+
+    def recording_extract_subreddits(*args):
+        extract_subreddits(*args)
+        extracts.append(reader._extracts_folder.name)
+
+    def failing_save(users, path):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(reader, 'extract_subreddits', recording_extract_subreddits)
+    monkeypatch.setattr(RedditHandler, '_RedditHandler__save_data', staticmethod(failing_save))
+    handler = RedditHandler(str(tmp_path / 'out'), True, True, dump_reader=reader)
+    with pytest.raises(RuntimeError):
+        handler.extract_periodical_data('01/01/2021', '11/01/2021', {'news': ['a', 'b']})
+    assert extracts and not any(os.path.exists(folder) for folder in extracts)
+
+
+def test_resume_after_error_while_saving(tmp_path, monkeypatch):
+    client = FakeClient(['a', 'b'])
+    categories = {'news': ['a', 'b']}
+    RedditHandler(str(tmp_path / 'complete'), True, True, client=client).extract_periodical_data(
+        '01/01/2021', '11/01/2021', categories)
+    save_data = RedditHandler._RedditHandler__save_data
+    n_saves = [0]
+
+    def failing_save(users, path):
+        n_saves[0] += 1
+        if n_saves[0] == 3:
+            raise RuntimeError('disk full')
+        save_data(users, path)
+
+    handler = RedditHandler(str(tmp_path / 'resumed'), True, True, client=client)
+    monkeypatch.setattr(RedditHandler, '_RedditHandler__save_data', staticmethod(failing_save))
+    with pytest.raises(RuntimeError):
+        handler.extract_periodical_data('01/01/2021', '11/01/2021', categories)
+    monkeypatch.setattr(RedditHandler, '_RedditHandler__save_data', staticmethod(save_data))
+    handler.extract_periodical_data('01/01/2021', '11/01/2021', categories, resume=True)
+    complete = dict(load_category(str(tmp_path / 'complete' / 'Categories_raw_data' / 'news')))
+    assert complete and dict(load_category(str(tmp_path / 'resumed' / 'Categories_raw_data' / 'news'))) == complete
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+from src.text_cleaning import _reference_clean_raw_text, clean_many, clean_raw_text
+
+WORDS = ['the', 'stock', 'GME', 'to', 'moon', 'I', 'think', 'that', 'not', 'financial', 'advice', '100%',
+         '$420.69', 'Q3', '2021', 'x2y', '_1_', 'a_b', 'DD:', '&amp;', '&gt;', '&lt;', '&lt;b&gt;bold&lt;/b&gt;',
+         '&lt;/A&gt;', '[deleted]', '[removed]', '[DELETED]', 'http://i.imgur.com/x.png', 'http',
+         'https://www.reddit.com/r/wallstreetbets/comments/l6x130/', 'HTTPS://EXAMPLE.COM/Q?a=1&b=2', '🚀🚀🚀', 'café',
+         'naïve²', '①', '\n\n', '\t', '\r', '\x0b\x0c', '\x00', '...', '!!!', '(edit)', "don't", 'r/wallstreetbets',
+         'u/DeepFuckingValue', '  ', '']
+TEXTS = ['', ' ', '\n', 'Hello World', '12 34', 'a1 b2 c3d', 'café2 x', 'http://x.com', '[deleted]',
+         '&amp;&amp;', 'Ünïcödé TEXT 123abc']
+
+
+def make_texts(n_texts, seed=0):
+    rnd = random.Random(seed)
+    return TEXTS + [''.join(rnd.choice(WORDS) + rnd.choice(['', ' ', '  ', '.', ',', '\n'])
+                            for _ in range(rnd.randint(0, 60))) for _ in range(n_texts)]
+
+
+def test_clean_raw_text_matches_reference():
+    for text in make_texts(3000):
+        assert clean_raw_text(text) == _reference_clean_raw_text(text), repr(text)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_clean_many_matches_reference(n_jobs):
+    texts = make_texts(500, seed=1)
+    assert clean_many(texts, n_jobs=n_jobs, chunksize=100) == [_reference_clean_raw_text(text) for text in texts]
@@ -0,0 +1,56 @@
+import pytest
+
+stop_words = pytest.importorskip('stop_words')
+
+from src.lstm_inference import VocabTokenizer, pad_post
+from src.text_encoder import TextEncoder
+
+TRAINING_TEXTS = ['the market is going up, buy now', 'Vote for the best candidate', 'taxes are too high!',
+                  "it's a good day for the economy", 'the election is rigged', 'stocks and bonds, bonds and stocks']
+TEXTS = ['', '   ', 'The market is going UP!!! buy... now?', 'it is the best; the BEST', "it's  taxes\tare\nhigh",
+         'unknown words everywhere', 'vote,for,the,candidate', 'Stocks & bonds (and) stocks', 'the the the',
+         'élection économie', 'a' * 50, 'buy-now vote/elect candidate:best']
+FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+
+def make_tokenizer(**kwargs):
+    """
+    keras Tokenizer fitted on TRAINING_TEXTS, or its keras-free copy VocabTokenizer when keras 2 is not installed
+    """
+    try:
+        from keras.preprocessing.text import Tokenizer
+    except ImportError:
+        kwargs = dict({'filters': FILTERS}, **kwargs)
+        tokenizer = VocabTokenizer(dict(), **kwargs)
+        words = [kwargs['oov_token']] if kwargs.get('oov_token') else []
+        words += sorted({word for text in TRAINING_TEXTS for word in tokenizer.words(text)})
+        return VocabTokenizer({word: index for index, word in enumerate(words, 1)}, **kwargs)
+    tokenizer = Tokenizer(**kwargs)
+    tokenizer.fit_on_texts(TRAINING_TEXTS)
+    return tokenizer
+
+
+def reference_sequences(tokenizer, texts):
+    # stop words removal and tokenization of PolarizationClassifier before the TextEncoder
+    english_stop_words = stop_words.get_stop_words('en')
+    return tokenizer.texts_to_sequences([' '.join(word for word in text.split() if word not in english_stop_words)
+                                         for text in texts])
+
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(oov_token='<OOV>'), dict(num_words=8, oov_token='<OOV>'),
+                                    dict(num_words=8), dict(lower=False), dict(filters=''), dict(char_level=True)])
+def test_encoder_matches_stop_words_and_tokenizer(kwargs):
+    tokenizer = make_tokenizer(**kwargs)
+    encoder = TextEncoder(tokenizer)
+    expected = reference_sequences(tokenizer, TEXTS)
+    # twice, the second time from the memo of the words
+    assert encoder.texts_to_sequences(TEXTS) == expected
+    assert encoder.texts_to_sequences(TEXTS) == expected
+    assert (encoder.encode(TEXTS, maxlen=6) == pad_post(expected, maxlen=6)).all()
+
+
+def test_encoder_with_emptied_memo():
+    tokenizer = make_tokenizer(oov_token='<OOV>')
+    encoder = TextEncoder(tokenizer, max_words=3)
+    for text in TEXTS + TEXTS:
+        assert encoder.texts_to_sequences([text]) == reference_sequences(tokenizer, [text])